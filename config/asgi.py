@@ -13,4 +13,16 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from problems import events  # noqa: E402, needs apps loaded
+from problems.warmup import warm_on_startup  # noqa: E402
+
+warm_on_startup()
+
+
+async def application(scope, receive, send):
+    """django, and pushed grading states of solutions by plain ASGI app"""
+    if scope["type"] == "http" and events.PATH.match(scope["path"]):
+        return await events.application(scope, receive, send)
+    return await django_application(scope, receive, send)
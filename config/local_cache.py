@@ -0,0 +1,56 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class LocalCache:
+    """
+    bounded in-process LRU cache with ttl.
+    least recently used key is evicted when max_size exceeded.
+    """
+
+    def __init__(self, max_size, ttl, on_evict=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.on_evict = on_evict  # called with key evicted by size or ttl
+        self._data = OrderedDict()  # key : (value, expiry)
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+
+            value, expiry = entry
+            if expiry <= time.monotonic():
+                del self._data[key]
+                self._evicted(key)
+                return default
+
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        ttl = ttl if ttl else self.ttl
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                evicted, _ = self._data.popitem(last=False)
+                self._evicted(evicted)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def _evicted(self, key):
+        if self.on_evict:
+            self.on_evict(key)
+
+    def __len__(self):
+        return len(self._data)
@@ -0,0 +1,201 @@
+"""
+Cache instrumentation, counters and latency histograms labeled by key family.
+recorded in process, and flushed to redis periodically to be aggregated
+between processes. see 'python manage.py cache_metrics'.
+"""
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from django_redis import get_redis_connection
+from django_redis.serializers import pickle
+from redis.exceptions import RedisError
+
+ENABLED = settings.CACHE_METRICS_ENABLED
+FLUSH_INTERVAL = settings.CACHE_METRICS_FLUSH_INTERVAL
+
+# upper bounds of latency buckets, milliseconds
+BUCKETS = (0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, float("inf"))
+
+# redis hash, fields are 'family|name' or 'family|op|le' for latency buckets.
+METRICS_KEY = "metrics.cache"
+
+_counters = defaultdict(int)  # (family, name) : value
+# (family, op) : counts of buckets, and sum at last
+_latencies = defaultdict(lambda: [0] * (len(BUCKETS) + 1))
+_flushed = {}  # values of _counters and _latencies at last flush
+_lock = threading.Lock()
+_local = threading.local()  # family of current cache operation
+_next_flush = time.monotonic() + FLUSH_INTERVAL
+
+
+def family(key) -> str:
+    """
+    label of key, first two parts of key.
+    'problems.1' -> 'problems.<id>'
+    'problems.levels=1,2.categories=.generation=0' -> 'problems.levels=...'
+    """
+    parts = str(key).split(".", 2)[:2]
+    if len(parts) == 2:
+        if parts[1].isdigit():
+            parts[1] = "<id>"
+        elif "=" in parts[1]:
+            parts[1] = parts[1].split("=", 1)[0] + "=..."
+    return ".".join(parts)
+
+
+def incr(family, name, value=1):
+    if not ENABLED:
+        return
+
+    with _lock:
+        _counters[(family, name)] += value
+    _flush_if_due()
+
+
+@contextmanager
+def timed(family, op):
+    """record latency of operation, and label payload bytes in it"""
+    if not ENABLED:
+        yield
+        return
+
+    _local.family = family
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = (time.perf_counter() - start) * 1000
+        _local.family = None
+        with _lock:
+            buckets = _latencies[(family, op)]
+            buckets[_bucket(elapsed)] += 1
+            buckets[-1] += elapsed
+        _flush_if_due()
+
+
+def _bucket(elapsed):
+    for i, bound in enumerate(BUCKETS):
+        if elapsed <= bound:
+            return i
+
+
+class PickleSerializer(pickle.PickleSerializer):
+    """pickle serializer counting payload bytes for family of current operation"""
+
+    def dumps(self, value):
+        data = super().dumps(value)
+        _record_bytes("bytes_written", len(data))
+        return data
+
+    def loads(self, value):
+        _record_bytes("bytes_read", len(value))
+        return super().loads(value)
+
+
+def _record_bytes(name, size):
+    incr(getattr(_local, "family", None) or "other", name, size)
+
+
+def _fields():
+    """current values as {redis hash field: value}"""
+    fields = {f"{f}|{name}": value for (f, name), value in _counters.items()}
+    for (f, op), buckets in _latencies.items():
+        for bound, count in zip(BUCKETS, buckets):
+            fields[f"{f}|{op}|{bound}"] = count
+        fields[f"{f}|{op}|sum"] = buckets[-1]
+    return fields
+
+
+def _flush_if_due():
+    global _next_flush
+
+    if time.monotonic() < _next_flush:
+        return
+    _next_flush = time.monotonic() + FLUSH_INTERVAL
+    try:
+        flush()
+    except RedisError:
+        pass  # metrics never fail request, lost until next flush.
+
+
+def flush():
+    """add values since last flush into redis hash"""
+    with _lock:
+        fields = _fields()
+        deltas = {k: v - _flushed.get(k, 0) for k, v in fields.items()}
+        _flushed.update(fields)
+
+    pipeline = get_redis_connection("default").pipeline(transaction=False)
+    for field, delta in deltas.items():
+        if isinstance(delta, float):
+            pipeline.hincrbyfloat(METRICS_KEY, field, delta)
+        elif delta:
+            pipeline.hincrby(METRICS_KEY, field, delta)
+    pipeline.execute()
+
+
+def aggregated():
+    """values of all processes from redis, {field: value}"""
+    values = get_redis_connection("default").hgetall(METRICS_KEY)
+    return {field.decode(): float(value) for field, value in values.items()}
+
+
+def prometheus(fields):
+    """prometheus text exposition of {field: value}"""
+    lines = []
+    for field, value in sorted(fields.items()):
+        parts = field.split("|")
+        if len(parts) == 2:
+            lines.append(
+                f'cache_events_total{{family="{parts[0]}",name="{parts[1]}"}} {value}'
+            )
+        elif parts[2] == "sum":
+            lines.append(
+                f'cache_latency_ms_sum{{family="{parts[0]}",op="{parts[1]}"}} {value}'
+            )
+    for (f, op), buckets in sorted(_cumulative(fields).items()):
+        for bound, count in zip(BUCKETS, buckets):
+            le = "+Inf" if bound == float("inf") else bound
+            lines.append(
+                f'cache_latency_ms_bucket{{family="{f}",op="{op}",le="{le}"}} {count}'
+            )
+    return "\n".join(lines) + "\n"
+
+
+def _cumulative(fields):
+    """{(family, op): cumulative bucket counts}"""
+    histograms = defaultdict(lambda: [0] * len(BUCKETS))
+    for field, value in fields.items():
+        parts = field.split("|")
+        if len(parts) == 3 and parts[2] != "sum":
+            index = BUCKETS.index(float(parts[2]))
+            histograms[(parts[0], parts[1])][index] += value
+
+    for buckets in histograms.values():
+        for i in range(1, len(buckets)):
+            buckets[i] += buckets[i - 1]
+    return histograms
+
+
+def percentile(fields, family, op, q):
+    """estimated upper bound of q(0 ~ 1) percentile latency, milliseconds"""
+    buckets = _cumulative(fields).get((family, op))
+    if not buckets or not buckets[-1]:
+        return None
+    for bound, count in zip(BUCKETS, buckets):
+        if count >= buckets[-1] * q:
+            return bound
+
+
+def metrics_view(request):
+    """metrics of this process, for local(INTERNAL_IPS) requests only"""
+    if request.META.get("REMOTE_ADDR") not in settings.INTERNAL_IPS:
+        raise Http404
+
+    with _lock:
+        fields = _fields()
+    return HttpResponse(prometheus(fields), content_type="text/plain; version=0.0.4")
@@ -0,0 +1,124 @@
+"""
+publish / subscribe interface between processes.
+'redis' backend uses redis pub/sub, 'local' backend dispatches in process. (for test)
+redis pub/sub connection is owned by single listener thread, which applies
+subscriptions between reads and reconnects on failure. PubSub of redis-py is
+not thread-safe.
+"""
+import logging
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django_redis import get_redis_connection
+
+logger = logging.getLogger(__name__)
+
+SUBSCRIBE_TIMEOUT = 5  # seconds, wait until listener subscribed
+READ_TIMEOUT = 0.1  # seconds, subscriptions are applied between reads
+RECONNECT_DELAY = 1  # seconds, after listener failed
+
+_handlers = {}  # channel : [callback]
+_lock = threading.Lock()
+_commands = queue.Queue()  # (method name, channel, event set when sent)
+_thread = None
+
+
+def publish(channel, message):
+    """publish string message to channel"""
+    if settings.PUBSUB_BACKEND == "local":
+        _dispatch(channel, message)
+        return
+
+    get_redis_connection("default").publish(channel, message)
+
+
+def subscribe(channel, callback):
+    """
+    call callback(message) on each message published to channel.
+    blocks until listener subscribed channel, not to miss messages after.
+    call from executor in event loop.
+    """
+    with _lock:
+        callbacks = _handlers.setdefault(channel, [])
+        callbacks.append(callback)
+        if settings.PUBSUB_BACKEND == "local" or len(callbacks) > 1:
+            return
+        subscribed = threading.Event()
+        _commands.put(("subscribe", channel, subscribed))
+        _start_listener()
+
+    if not subscribed.wait(SUBSCRIBE_TIMEOUT):
+        logger.warning("subscribe %s not confirmed, listener reconnecting", channel)
+
+
+def unsubscribe(channel, callback):
+    with _lock:
+        callbacks = _handlers.get(channel, [])
+        if callback in callbacks:
+            callbacks.remove(callback)
+        if callbacks:
+            return
+        _handlers.pop(channel, None)
+        if _thread is not None:
+            _commands.put(("unsubscribe", channel, threading.Event()))
+
+
+def _dispatch(channel, message):
+    for callback in list(_handlers.get(channel, [])):
+        try:
+            callback(message)
+        except Exception:
+            logger.exception("pubsub callback of %s failed", channel)
+
+
+def _on_message(message):
+    channel = message["channel"].decode()
+    _dispatch(channel, message["data"].decode())
+
+
+def _start_listener():
+    """start listener thread at first, or again if it has exited. call in _lock"""
+    global _thread
+
+    if _thread is None or not _thread.is_alive():
+        _thread = threading.Thread(target=_listen, name="pubsub", daemon=True)
+        _thread.start()
+
+
+def _listen():
+    """
+    read messages, and apply subscriptions between reads.
+    on failure, reconnected and every channel subscribed again.
+    """
+    while True:
+        pubsub = get_redis_connection("default").pubsub(ignore_subscribe_messages=True)
+        try:
+            with _lock:
+                channels = list(_handlers)
+            if channels:
+                pubsub.subscribe(*channels)
+            while True:
+                _apply_commands(pubsub)
+                message = pubsub.get_message(timeout=READ_TIMEOUT)
+                if message is not None:
+                    _on_message(message)
+        except Exception:
+            logger.exception("pubsub listener failed, reconnecting")
+            pubsub.reset()
+            time.sleep(RECONNECT_DELAY)
+
+
+def _apply_commands(pubsub):
+    while True:
+        try:
+            method, channel, sent = _commands.get_nowait()
+        except queue.Empty:
+            return
+        try:
+            getattr(pubsub, method)(channel)
+        except Exception:
+            _commands.put((method, channel, sent))  # retried after reconnect
+            raise
+        sent.set()
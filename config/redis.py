@@ -1,28 +1,509 @@
+import math
 import random
+import time
+import uuid
 
 from django.core.cache import cache
 from django.conf import settings
+from django_redis import get_redis_connection
+from redis.exceptions import LockError, WatchError
+
+from . import metrics, pubsub
+from .local_cache import LocalCache
 
 TTL = settings.REDIS_CACHE_TTL
+XFETCH_BETA = settings.REDIS_XFETCH_BETA
+LOCK_TIMEOUT = settings.REDIS_LOCK_TIMEOUT
+LOCK_WAIT_TIMEOUT = settings.REDIS_LOCK_WAIT_TIMEOUT
+NEGATIVE_TTL = settings.REDIS_NEGATIVE_TTL
+LOCK_POLL_INTERVAL = 0.1  # seconds, same as lock of redis-py
+
+# use .format()
+LOCK_KEY = "lock.{}"
+
+# cached in place of value, when loader raised 'missing' exception.
+TOMBSTONE = "__tombstone__"
+
+# member of every cached set, so that cached empty set exists.
+SET_SENTINEL = 0
+
+# add to set only if cached, never create partial set.
+_ADD_IF_EXISTS = """
+if redis.call('exists', KEYS[1]) == 1 then
+    return redis.call('sadd', KEYS[1], ARGV[1])
+end
+return 0
+"""
+
+# replace set only if generation not changed since members were loaded.
+_SET_IF_GENERATION = """
+if (redis.call('get', KEYS[2]) or '0') ~= ARGV[1] then
+    return 0
+end
+redis.call('del', KEYS[1])
+for i = 3, #ARGV do
+    redis.call('sadd', KEYS[1], ARGV[i])
+end
+redis.call('expire', KEYS[1], ARGV[2])
+return 1
+"""
+
+# delete lock only if still held by token, not one taken after expiry.
+_RELEASE_IF_TOKEN = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+# channel to evict keys from local cache of every process, newline separated.
+INVALIDATION_CHANNEL = "cache.invalidation"
+
+# L1, in front of redis.
+local_cache = LocalCache(
+    settings.LOCAL_CACHE_MAX_SIZE,
+    settings.LOCAL_CACHE_TTL,
+    on_evict=lambda key: metrics.incr(metrics.family(key), "local_evictions"),
+)
+_local_subscribed = False
 
 
 def get(key):
-    return cache.get(key)
+    family = metrics.family(key)
+    with metrics.timed(family, "get"):
+        value = cache.get(key)
+
+    metrics.incr(family, "misses" if value is None else "hits")
+    return value
 
 
 def set(key, value, timeout=None):
     timeout = timeout if timeout else TTL
-    cache.set(key, value, timeout)
+    family = metrics.family(key)
+    with metrics.timed(family, "set"):
+        cache.set(key, value, timeout)
+    metrics.incr(family, "sets")
+
+
+def get_many(keys):
+    """labeled by family of first key"""
+    if not keys:
+        return {}
+
+    with metrics.timed(metrics.family(keys[0]), "get_many"):
+        values = cache.get_many(keys)
+
+    for key in keys:
+        metrics.incr(metrics.family(key), "hits" if key in values else "misses")
+    return values
 
 
-def fetch_aot(key, expiry_gap_ms):
+def set_many(values, timeout=None):
+    """labeled by family of first key"""
+    if not values:
+        return
+
+    timeout = timeout if timeout else TTL
+    with metrics.timed(metrics.family(next(iter(values))), "set_many"):
+        cache.set_many(values, timeout)
+
+    for key in values:
+        metrics.incr(metrics.family(key), "sets")
+
+
+def incr(key):
+    """increase integer value of key, created without expiry if not existed"""
+    with metrics.timed(metrics.family(key), "incr"):
+        return cache.incr(key, ignore_key_check=True)
+
+
+def incr_many(keys):
+    """incr of keys in single pipeline, labeled by family of first key"""
+    if not keys:
+        return
+    pipeline = get_redis_connection("default").pipeline(transaction=False)
+    for key in keys:
+        pipeline.incr(cache.make_key(key))
+    with metrics.timed(metrics.family(keys[0]), "incr_many"):
+        pipeline.execute()
+
+
+def _entry(value, delta, timeout):
+    """cache entry for get_or_compute, (value, recompute seconds, expiry timestamp)"""
+    return (value, delta, time.time() + timeout)
+
+
+def _should_recompute(delta, expiry, beta):
     """
+    XFetch, probabilistic early expiration.
     from nhn blog,
     https://meetup.nhncloud.com/posts/251
     """
-    ttl_ms = cache.pttl(key)  # pttl은 millisecond 단위
+    # 1 - random() is in (0, 1], log never fails.
+    return time.time() - delta * beta * math.log(1 - random.random()) >= expiry
+
+
+def _compute(key, loader, timeout, missing=None):
+    start = time.time()
+    try:
+        value = loader()
+    except missing or ():
+        # tombstone, repeated misses cost single read until short ttl.
+        value, timeout = TOMBSTONE, NEGATIVE_TTL
+        metrics.incr(metrics.family(key), "tombstones")
+    set(key, _entry(value, time.time() - start, timeout), timeout)
+    return value
+
+
+def _found(key, value, missing):
+    """value, or raise missing for tombstone"""
+    if missing is not None and value == TOMBSTONE:
+        metrics.incr(metrics.family(key), "tombstone_hits")
+        raise missing(f"{key} not found, cached")
+    return value
+
+
+def get_or_compute(key, loader, timeout=None, beta=None, missing=None):
+    """
+    get value of key, or call loader and cache it.
+    value is recomputed before expiry with probability growing on expiry,
+    and only one process which holds the lock recomputes it.
+    others keep return stale value while recomputing.
+    can raise whatever loader raise, nothing cached then.
+    except 'missing' exception class, which is cached as tombstone
+    for NEGATIVE_TTL and raised again on hit.
+    """
+    return _found(key, _get_or_compute(key, loader, timeout, beta, missing), missing)
+
+
+def _get_or_compute(key, loader, timeout, beta, missing):
+    """get_or_compute returning tombstone as it is"""
+    timeout = timeout if timeout else TTL
+    beta = beta if beta else XFETCH_BETA
+
+    entry = get(key)
+    if entry is not None:
+        value, delta, expiry = entry
+        if not _should_recompute(delta, expiry, beta):
+            return value
+
+        lock = cache.lock(LOCK_KEY.format(key), timeout=LOCK_TIMEOUT)
+        if not lock.acquire(blocking=False):
+            metrics.incr(metrics.family(key), "stale_hits")
+            return value  # someone is recomputing, serve stale.
+
+        metrics.incr(metrics.family(key), "early_recomputes")
+        try:
+            return _compute(key, loader, timeout, missing)
+        finally:
+            _release(key, lock)
+
+    # cache miss, wait for other process which is computing.
+    lock = cache.lock(LOCK_KEY.format(key), timeout=LOCK_TIMEOUT)
+    if not lock.acquire(blocking=True, blocking_timeout=LOCK_WAIT_TIMEOUT):
+        metrics.incr(metrics.family(key), "lock_timeouts")
+        entry = get(key)
+        if entry is not None:
+            return entry[0]
+        return loader()  # waited too long, do not block client more.
+
+    try:
+        entry = get(key)
+        if entry is not None:
+            return entry[0]
+        return _compute(key, loader, timeout, missing)
+    finally:
+        _release(key, lock)
+
+
+def _release(key, lock):
+    """release lock, which may be expired while loader ran past LOCK_TIMEOUT"""
+    try:
+        lock.release()
+    except LockError:
+        metrics.incr(metrics.family(key), "lock_expired")
+
+
+def _lock_many(keys, token):
+    """keys which locks are acquired by token, without blocking, single pipeline"""
+    pipeline = get_redis_connection("default").pipeline(transaction=False)
+    for key in keys:
+        pipeline.set(
+            cache.make_key(LOCK_KEY.format(key)), token, nx=True, ex=LOCK_TIMEOUT
+        )
+    return [key for key, locked in zip(keys, pipeline.execute()) if locked]
+
+
+def _unlock_many(keys, token):
+    """release locks of _lock_many, not ones taken by others after expiry"""
+    if not keys:
+        return
+    pipeline = get_redis_connection("default").pipeline(transaction=False)
+    for key in keys:
+        pipeline.eval(_RELEASE_IF_TOKEN, 1, cache.make_key(LOCK_KEY.format(key)), token)
+    for key, released in zip(keys, pipeline.execute()):
+        if not released:
+            metrics.incr(metrics.family(key), "lock_expired")
+
+
+def _on_invalidation(message):
+    for key in message.split("\n"):
+        local_cache.delete(key)
+
+
+def _subscribe_local():
+    global _local_subscribed
+
+    if not _local_subscribed:
+        pubsub.subscribe(INVALIDATION_CHANNEL, _on_invalidation)
+        _local_subscribed = True
+
+
+def get_or_compute_local(key, loader, timeout=None, missing=None):
+    """
+    get_or_compute with local cache in front of redis.
+    local cache of each process is evicted by invalidate_local.
+    """
+    _subscribe_local()
+
+    value = local_cache.get(key)
+    if value is not None:
+        metrics.incr(metrics.family(key), "local_hits")
+        return _found(key, value, missing)
+
+    value = _get_or_compute(key, loader, timeout, None, missing)
+    local_cache.set(key, value)
+    return _found(key, value, missing)
+
+
+def get_or_compute_many_local(keys, loader, timeout=None):
+    """
+    get values of keys, local cache -> redis(single round trip) -> loader.
+    loader(missed keys) returns {key: value} at once, and those are cached.
+    keys which loader not returned are cached as tombstone, and omitted
+    from returned {key: value}.
+    same protection as get_or_compute, per key. only holder of lock of key
+    loads it, early by XFetch or on miss. keys locked by others are served
+    stale, or waited until cached up to LOCK_WAIT_TIMEOUT then loaded too.
+    """
+    _subscribe_local()
+    timeout = timeout if timeout else TTL
+
+    values = {}
+    for key in keys:
+        value = local_cache.get(key)
+        if value is not None:
+            metrics.incr(metrics.family(key), "local_hits")
+            values[key] = value
+
+    fetched, stale = {}, []
+    missed = [key for key in keys if key not in values]
+    if missed:
+        for key, (value, delta, expiry) in get_many(missed).items():
+            fetched[key] = value
+            if _should_recompute(delta, expiry, XFETCH_BETA):
+                stale.append(key)
+
+    missed = [key for key in missed if key not in fetched]
+    if missed or stale:
+        token = uuid.uuid4().hex
+        locked = _lock_many(missed + stale, token)
+        try:
+            for key in stale:
+                name = "early_recomputes" if key in locked else "stale_hits"
+                metrics.incr(metrics.family(key), name)
+            fetched.update(_wait_many([key for key in missed if key not in locked]))
+            load = [
+                key for key in missed + stale if key not in fetched or key in locked
+            ]
+            if load:
+                fetched.update(_load_many(load, loader, timeout))
+        finally:
+            _unlock_many(locked, token)
+
+    for key, value in fetched.items():
+        local_cache.set(key, value)
+    values.update(fetched)
+
+    return {key: value for key, value in values.items() if value != TOMBSTONE}
+
+
+def _wait_many(keys):
+    """{key: value} cached by other processes holding locks of keys, in wait time"""
+    waited = {}
+    deadline = time.monotonic() + LOCK_WAIT_TIMEOUT
+    while keys and time.monotonic() < deadline:
+        time.sleep(LOCK_POLL_INTERVAL)
+        for key, entry in get_many(keys).items():
+            waited[key] = entry[0]
+        keys = [key for key in keys if key not in waited]
+
+    for key in keys:
+        metrics.incr(metrics.family(key), "lock_timeouts")
+    return waited
+
+
+def _load_many(keys, loader, timeout):
+    """loader(keys) cached as entries, tombstones for keys not loaded"""
+    start = time.time()
+    loaded = loader(keys)
+    delta = (time.time() - start) / len(keys)
+    set_many(
+        {key: _entry(value, delta, timeout) for key, value in loaded.items()},
+        timeout,
+    )
+    tombstones = [key for key in keys if key not in loaded]
+    set_many(
+        {key: _entry(TOMBSTONE, delta, NEGATIVE_TTL) for key in tombstones},
+        NEGATIVE_TTL,
+    )
+    return {**loaded, **dict.fromkeys(tombstones, TOMBSTONE)}
+
+
+def invalidate_local(key):
+    """evict key from local cache of this and other processes"""
+    invalidate_local_many([key])
+
+
+def invalidate_local_many(keys):
+    """invalidate_local of keys in single message"""
+    if not keys:
+        return
+    for key in keys:
+        local_cache.delete(key)
+        metrics.incr(metrics.family(key), "invalidations")
+    pubsub.publish(INVALIDATION_CHANNEL, "\n".join(keys))
+
+
+def update(key, value, timeout=None):
+    """set value to key which is used by get_or_compute"""
+    timeout = timeout if timeout else TTL
+    set(key, _entry(value, 0, timeout), timeout)
+    invalidate_local(key)
+
+
+def patch(key, values):
+    """
+    update items of cached dict of key used by get_or_compute, keeping expiry.
+    nothing if not cached, or if key was written meanwhile.
+    evicted from local cache of this process only, others until local ttl.
+    """
+    raw = cache.make_key(key)
+    connection = get_redis_connection("default")
+    with metrics.timed(metrics.family(key), "patch"):
+        with connection.pipeline() as pipeline:
+            try:
+                pipeline.watch(raw)
+                entry = pipeline.get(raw)
+                ttl = pipeline.ttl(raw)
+                if entry is None or ttl <= 0:
+                    return
+                value, delta, expiry = cache.client.decode(entry)
+                if value == TOMBSTONE:
+                    return
+                pipeline.multi()
+                pipeline.set(
+                    raw,
+                    cache.client.encode((dict(value, **values), delta, expiry)),
+                    ex=ttl,
+                )
+                pipeline.execute()
+            except WatchError:
+                return  # written meanwhile, by refresh or other patch.
+            finally:
+                local_cache.delete(key)
+    metrics.incr(metrics.family(key), "sets")
+
+
+def preload(values, timeout=None):
+    """set {key: value} used by get_or_compute in single pipeline, for warm up"""
+    timeout = timeout if timeout else TTL
+    set_many({key: _entry(value, 0, timeout) for key, value in values.items()}, timeout)
+
+
+def delete(key):
+    """delete key from redis and local cache of every process"""
+    with metrics.timed(metrics.family(key), "delete"):
+        cache.delete(key)
+    invalidate_local(key)
+
+
+def delete_many(keys):
+    """delete keys from redis and local cache of every process, labeled by first key"""
+    if not keys:
+        return
+    with metrics.timed(metrics.family(keys[0]), "delete_many"):
+        cache.delete_many(keys)
+    invalidate_local_many(keys)
+
+
+def get_set(key):
+    """integer members of cached set, None if not cached"""
+    family = metrics.family(key)
+    with metrics.timed(family, "get_set"):
+        members = get_redis_connection("default").smembers(cache.make_key(key))
+
+    metrics.incr(family, "hits" if members else "misses")
+    if not members:
+        return None
+    return {int(member) for member in members} - {SET_SENTINEL}
+
+
+def set_set(key, members, timeout=None, guard=None):
+    """
+    cache set of integer members, replacing old one.
+    guard : (generation key, generation read before members loaded),
+    not cached if generation changed meanwhile. returns whether cached.
+    """
+    timeout = timeout if timeout else TTL
+    if guard is not None:
+        generation_key, generation = guard
+        connection = get_redis_connection("default")
+        with metrics.timed(metrics.family(key), "set_set"):
+            cached = connection.eval(
+                _SET_IF_GENERATION,
+                2,
+                cache.make_key(key),
+                cache.make_key(generation_key),
+                generation,
+                timeout,
+                SET_SENTINEL,
+                *members,
+            )
+        metrics.incr(metrics.family(key), "sets" if cached else "stale_sets")
+        return bool(cached)
+
+    raw = cache.make_key(key)
+    pipeline = get_redis_connection("default").pipeline()
+    pipeline.delete(raw)
+    pipeline.sadd(raw, SET_SENTINEL, *members)
+    pipeline.expire(raw, timeout)
+    with metrics.timed(metrics.family(key), "set_set"):
+        pipeline.execute()
+    metrics.incr(metrics.family(key), "sets")
+    return True
+
+
+def get_generation(key):
+    """integer counter bumped by bump_generation, 0 if not exists"""
+    return int(get_redis_connection("default").get(cache.make_key(key)) or 0)
+
+
+def bump_generation(key, timeout=None):
+    """increase generation of key, values loaded before are not cached"""
+    timeout = timeout if timeout else TTL
+    pipeline = get_redis_connection("default").pipeline()
+    pipeline.incr(cache.make_key(key))
+    pipeline.expire(cache.make_key(key), timeout)
+    pipeline.execute()
+
+
+def add_to_set(key, member):
+    """add member to cached set, nothing if not cached"""
+    connection = get_redis_connection("default")
+    with metrics.timed(metrics.family(key), "add_to_set"):
+        connection.eval(_ADD_IF_EXISTS, 1, cache.make_key(key), member)
 
-    if ttl_ms - (random() * expiry_gap_ms) > 0:
-        return cache.get(key)
 
-    return None
+def exists(key):
+    return cache.has_key(key)
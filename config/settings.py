@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.1/ref/settings/
 """
 
+import sys
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -27,6 +28,9 @@ DEBUG = True
 
 ALLOWED_HOSTS = []
 
+# requests from these can see metrics, /metrics/cache
+INTERNAL_IPS = ["127.0.0.1"]
+
 
 # Application definition
 
@@ -136,7 +140,30 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 # rest framework
 REST_FRAMEWORK = {
     "PAGE_SIZE": 2,
+    "DEFAULT_RENDERER_CLASSES": [
+        "config.renderers.FastJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
 }
+RECOMMENDATION_MAX_LIMIT = 20  # problems per recommendation
+PROBLEM_INDEX_ENABLED = True  # filter lists and recommend from in-process index
+PROBLEM_INDEX_TTL = 5 * 60  # seconds, full reload bounds drift of lost events
+SOLVED_SET_TTL = 10 * 60  # seconds, solved problems of user
+SOLUTION_HISTORY_PAGE_SIZE = 20  # solutions per page of history
+SOLUTION_HISTORY_MAX_LIMIT = 100
+SOLUTION_STATE_TTL = 10 * 60  # seconds, solution cached while grading
+SOLUTION_EVENTS_TIMEOUT = 30  # seconds, stream or long-poll of grading states
+SOLUTION_EVENTS_KEEPALIVE = 15  # seconds, comment sent to idle stream
+PROBLEM_IMPORT_BATCH_SIZE = 500  # rows per INSERT of bulk import
+PROBLEM_IMPORT_MAX_ROWS = 5000  # rows per import request
+GRADING_BATCH_ENABLED = False  # grade pending solutions in batches, not one by one
+GRADING_BATCH_SIZE = 100  # solutions per batch grading task
+GRADING_CLAIM_TIMEOUT = 5 * 60  # seconds, checking solution claimed again after
+GRADING_MAX_RETRIES = 3  # retries of grading on database errors
+VERDICT_TTL = 60 * 60  # seconds, memoized score of answer digest
+INLINE_GRADING_ENABLED = True  # grade in request when verdict is memoized
+INLINE_GRADING_MAX_LENGTH = 10_000  # characters of answers, longer ones are queued
+INLINE_GRADING_CONCURRENCY = 8  # inline gradings at once per process
 
 # Celery Configuration Options
 CELERY_TIMEZONE = "Asia/Seoul"
@@ -156,12 +183,32 @@ CACHES = {
         "TIMEOUT": REDIS_CACHE_TTL,
         "OPTIONS": {
             "CLIENT_CLASS": "django_redis.client.DefaultClient",
+            "SERIALIZER": "config.metrics.PickleSerializer",  # count payload bytes
         },
     }
 }
+if sys.argv[1:2] == ["test"]:
+    # own database and prefix, tests never touch keys of development.
+    CACHES["default"]["LOCATION"] = "redis://localhost:6379/15"
+    CACHES["default"]["KEY_PREFIX"] = "test"
+REDIS_XFETCH_BETA = 1.0  # > 1.0 favors earlier recompute
+REDIS_LOCK_TIMEOUT = 30  # seconds, lock for recompute expires
+REDIS_LOCK_WAIT_TIMEOUT = 5  # seconds, wait other process recompute on miss
+REDIS_NEGATIVE_TTL = 30  # seconds, tombstones of not found values
+# local(in-process) cache in front of redis
+LOCAL_CACHE_MAX_SIZE = 1024  # keys
+LOCAL_CACHE_TTL = 10  # seconds, bound staleness when invalidation message lost
+PUBSUB_BACKEND = "redis"  # or "local", in-process only
+RESPONSE_CACHE_TTL = 60 * 60  # seconds, rendered responses validated by versions
+RESPONSE_COUNTS_TTL = 60  # seconds, responses with submission counts, not versioned
+CACHE_METRICS_ENABLED = True
+CACHE_METRICS_FLUSH_INTERVAL = 10  # seconds, flush process metrics to redis
+CACHE_WARMUP_ON_STARTUP = False  # warm cache in background thread when app ready
+CACHE_WARMUP_CHUNK_SIZE = 500  # problems per query and pipeline
+CACHE_WARMUP_CONCURRENCY = 4  # threads, each holds a database connection
 
 # For debug,
 DEBUG_PROBLEM_QUERY_DELAY = 1  # second
 DEBUG_PROBLEM_CHECK_DELAY = 10  # second
 DEBUG_REDIS_PROBLEM_TTL = 1 * 60 * 60  # seconds
-DEBUG_REDIS_QUERY_TTL = 1 * 60 * 60  # seconds
+DEBUG_REDIS_QUERY_TTL = 24 * 60 * 60  # seconds, lists are invalidated by generation
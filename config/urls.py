@@ -16,9 +16,10 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 
-from . import swagger
+from . import metrics, swagger
 
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("problems/", include("problems.urls")),
+    path("metrics/cache", metrics.metrics_view, name="cache-metrics"),
 ] + swagger.urlpatterns
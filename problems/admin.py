@@ -2,6 +2,7 @@ from django.contrib import admin
 
 from .models import (
     Problem,
+    ProblemStats,
     Category,
     Answer,
     Commentary,
@@ -15,6 +16,11 @@ class ProblemAdmin(admin.ModelAdmin):
     pass
 
 
+@admin.register(ProblemStats)
+class ProblemStatsAdmin(admin.ModelAdmin):
+    pass
+
+
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
     pass
@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class ProblemsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "problems"
+
+    def ready(self):
+        from . import signals  # noqa: F401, connect cache invalidation
+
+        # cache is warmed by server entry points, see warmup.warm_on_startup.
+        # not here, ready() runs for every command before schema may exist.
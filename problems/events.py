@@ -0,0 +1,220 @@
+"""
+Grading states of solutions pushed to clients, instead of polling.
+states are published on SOLUTION_EVENTS_CHANNEL whenever cached, see models,
+and dispatched to streams waiting in this process.
+served as ASGI app, see config/asgi.py
+    GET /problems/<id>/solutions/<solution_id>/events
+    - 'Accept: text/event-stream', server-sent events of each state until done.
+    - otherwise long-poll, solution once done or current one on timeout.
+"""
+import asyncio
+import io
+import json
+import re
+import threading
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.core.handlers.asgi import ASGIRequest
+
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from config import pubsub
+
+from .models import SOLUTION_EVENTS_CHANNEL, Solution
+
+PATH = re.compile(r"^/problems/(?P<pk>\d+)/solutions/(?P<solution_id>\d+)/events/?$")
+
+# states only go forward, older events are dropped.
+STATES = [Solution.CHECK_BEFORE, Solution.CHEKING, Solution.CHECK_DONE]
+
+
+class Waiters:
+    """asyncio queues of streams in this process, waiting events of solutions"""
+
+    def __init__(self):
+        self._queues = {}  # solution id : {(loop, queue)}
+        self._lock = threading.Lock()
+        self._subscribe_lock = threading.Lock()
+        self._subscribed = False
+
+    async def add(self, solution_id):
+        """queue of events of solution, for running loop"""
+        loop = asyncio.get_running_loop()
+        if not self._subscribed:
+            # blocking subscribe, out of event loop
+            await loop.run_in_executor(None, self._subscribe)
+
+        waiter = (loop, asyncio.Queue())
+        with self._lock:
+            self._queues.setdefault(solution_id, set()).add(waiter)
+        return waiter
+
+    def _subscribe(self):
+        # others wait until subscribed, not to miss events.
+        with self._subscribe_lock:
+            if not self._subscribed:
+                pubsub.subscribe(SOLUTION_EVENTS_CHANNEL, self._on_message)
+                self._subscribed = True
+
+    def remove(self, solution_id, waiter):
+        with self._lock:
+            waiters = self._queues.get(solution_id, set())
+            waiters.discard(waiter)
+            if not waiters:
+                self._queues.pop(solution_id, None)
+
+    def __contains__(self, solution_id):
+        return solution_id in self._queues
+
+    def _on_message(self, message):
+        # called from listener thread of pubsub, or in place for local backend.
+        for line in message.split("\n"):
+            event = json.loads(line)
+            with self._lock:
+                waiters = list(self._queues.get(event["id"], ()))
+            for loop, queue in waiters:
+                loop.call_soon_threadsafe(queue.put_nowait, event)
+
+
+waiters = Waiters()
+
+
+def _noop(request):
+    return None
+
+
+def _user(scope):
+    """user of request, by default authentication classes of rest framework"""
+    request = ASGIRequest(scope, io.BytesIO())
+    SessionMiddleware(_noop).process_request(request)
+    AuthenticationMiddleware(_noop).process_request(request)
+    authenticators = [auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES]
+    try:
+        return Request(request, authenticators=authenticators).user
+    except APIException:
+        return None
+
+
+def _current(scope, pk, solution_id):
+    """
+    (status, event of solution), 401 for anonymous, 404 if not of user.
+    redis first like polling, database for solution done before.
+    """
+    user = _user(scope)
+    if user is None or not user.is_authenticated:
+        return 401, None
+
+    solution = Solution.objects.get_cached_state(pk, solution_id, user)
+    if solution is None:
+        solution = Solution.objects.filter(
+            pk=solution_id, submission__problem=pk, submission__user=user.id
+        ).first()
+    if solution is None:
+        return 404, None
+    return 200, Solution.objects.event(solution)
+
+
+async def _wait(queue, disconnected, timeout):
+    """next event in timeout, None on timeout or disconnect"""
+    get = asyncio.ensure_future(queue.get())
+    done, _ = await asyncio.wait(
+        {get, disconnected}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+    )
+    if get in done:
+        return get.result()
+    get.cancel()
+    return None
+
+
+def _forward(event, last):
+    """whether event is after last one"""
+    return STATES.index(event["state"]) > STATES.index(last["state"])
+
+
+async def _disconnected(receive):
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+async def _send_json(send, status, data):
+    body = json.dumps(data).encode()
+    headers = [
+        (b"content-type", b"application/json"),
+        (b"content-length", str(len(body)).encode()),
+    ]
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _stream(send, queue, disconnected, event):
+    """server-sent events of states until done, timeout or disconnect"""
+    headers = [
+        (b"content-type", b"text/event-stream"),
+        (b"cache-control", b"no-cache"),
+        (b"x-accel-buffering", b"no"),  # no buffering by nginx
+    ]
+    await send({"type": "http.response.start", "status": 200, "headers": headers})
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + settings.SOLUTION_EVENTS_TIMEOUT
+    chunk = f"event: state\ndata: {json.dumps(event)}\n\n"
+    while event["state"] != Solution.CHECK_DONE:
+        await send(
+            {"type": "http.response.body", "body": chunk.encode(), "more_body": True}
+        )
+        timeout = min(settings.SOLUTION_EVENTS_KEEPALIVE, deadline - loop.time())
+        received = await _wait(queue, disconnected, max(timeout, 0))
+        if disconnected.done():
+            return
+        if received is not None and _forward(received, event):
+            event = received
+            chunk = f"event: state\ndata: {json.dumps(event)}\n\n"
+        elif loop.time() >= deadline:
+            chunk = ""
+            break
+        else:
+            chunk = ": keepalive\n\n"  # idle, or event dropped
+    await send({"type": "http.response.body", "body": chunk.encode()})
+
+
+async def _long_poll(send, queue, disconnected, event):
+    """solution once done, or current one on timeout"""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + settings.SOLUTION_EVENTS_TIMEOUT
+    while event["state"] != Solution.CHECK_DONE and loop.time() < deadline:
+        received = await _wait(queue, disconnected, deadline - loop.time())
+        if disconnected.done():
+            return
+        if received is not None and _forward(received, event):
+            event = received
+    await _send_json(send, 200, event)
+
+
+async def application(scope, receive, send):
+    """ASGI app of solution events, for paths matched by PATH"""
+    match = PATH.match(scope["path"])
+    pk, solution_id = match["pk"], int(match["solution_id"])
+
+    # subscribe before reading current state, not to miss transitions.
+    waiter = await waiters.add(solution_id)
+    disconnected = asyncio.ensure_future(_disconnected(receive))
+    try:
+        status, event = await sync_to_async(_current)(scope, pk, solution_id)
+        if status == 401:
+            await _send_json(
+                send, 401, {"detail": "Authentication credentials were not provided."}
+            )
+        elif status == 404:
+            await _send_json(send, 404, {"detail": "Not found."})
+        elif b"text/event-stream" in dict(scope["headers"]).get(b"accept", b""):
+            await _stream(send, waiter[1], disconnected, event)
+        else:
+            await _long_poll(send, waiter[1], disconnected, event)
+    finally:
+        disconnected.cancel()
+        waiters.remove(solution_id, waiter)
@@ -0,0 +1,141 @@
+"""
+Bulk import of problems from JSON array or NDJSON.
+rows are validated one by one, and valid rows are inserted with bulk_create
+in single transaction, answers and commentaries too.
+caches are invalidated once for whole batch on commit, see signals.
+"""
+import json
+from itertools import chain
+
+from django.conf import settings
+from django.db import transaction
+
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+from .models import Answer, Category, Commentary, Problem
+from .serializers import ProblemImportSerializer
+
+INVALID_ROW = "invalid json object."
+
+
+def parse_lines(lines):
+    """rows of NDJSON lines, None for invalid line. blank lines are skipped"""
+    rows = []
+    for line in lines:
+        line = line.decode() if isinstance(line, bytes) else line
+        if not line.strip():
+            continue
+        try:
+            rows.append(json.loads(line))
+        except ValueError:
+            rows.append(None)
+    return rows
+
+
+def parse(stream):
+    """rows of text stream, JSON array or NDJSON"""
+    first = ""
+    for first in stream:
+        if first.strip():
+            break
+
+    if first.lstrip().startswith("["):
+        return json.loads(first + stream.read())
+    return parse_lines(chain([first], stream))
+
+
+class NDJSONParser(BaseParser):
+    """request body of newline delimited json, parsed to list of rows"""
+
+    media_type = "application/x-ndjson"
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if stream is None:
+            return []
+        try:
+            return parse_lines(stream)
+        except UnicodeDecodeError as exc:
+            raise ParseError(f"NDJSON parse error - {exc}")
+
+
+def validate(rows):
+    """
+    (valid rows as [(row number, validated data)], errors of invalid rows).
+    names and categories of whole batch are checked in single query each.
+    """
+    valid, errors = [], []
+    for i, row in enumerate(rows):
+        if not isinstance(row, dict):
+            errors.append({"row": i, "errors": {"non_field_errors": [INVALID_ROW]}})
+            continue
+
+        serializer = ProblemImportSerializer(data=row)
+        if serializer.is_valid():
+            valid.append((i, serializer.validated_data))
+        else:
+            errors.append({"row": i, "errors": serializer.errors})
+
+    names = [data["name"] for _, data in valid]
+    taken = set(
+        Problem.objects.all().filter(name__in=names).values_list("name", flat=True)
+    )
+    category_ids = {data.get("category") for _, data in valid} - {None}
+    categories = set(
+        Category.objects.all().filter(pk__in=category_ids).values_list("pk", flat=True)
+    )
+
+    checked = []
+    for i, data in valid:
+        category = data.get("category")
+        if data["name"] in taken:
+            error = {"name": ["problem with this name already exists."]}
+        elif category is not None and category not in categories:
+            error = {"category": [f'Invalid pk "{category}" - object does not exist.']}
+        else:
+            taken.add(data["name"])  # duplicated in batch
+            checked.append((i, data))
+            continue
+        errors.append({"row": i, "errors": error})
+
+    errors.sort(key=lambda error: error["row"])
+    return checked, errors
+
+
+def import_problems(rows, owner, batch_size=None):
+    """
+    create problems of valid rows owned by owner, in single transaction.
+    returns {"created": ids of created problems, "errors": errors of rows}
+    """
+    batch_size = batch_size if batch_size else settings.PROBLEM_IMPORT_BATCH_SIZE
+    valid, errors = validate(rows)
+    if not valid:
+        return {"created": [], "errors": errors}
+
+    data = [data for _, data in valid]
+    answers = [Answer(**row["answer"]) for row in data]
+    for answer in answers:
+        answer.update_digest()  # save() is not called by bulk_create
+
+    with transaction.atomic():
+        answers = Answer.objects.bulk_create(answers, batch_size=batch_size)
+        commentaries = Commentary.objects.bulk_create(
+            [Commentary(**row["commentary"]) for row in data], batch_size=batch_size
+        )
+        problems = Problem.objects.bulk_create(
+            [
+                Problem(
+                    name=row["name"],
+                    level=row["level"],
+                    description=row["description"],
+                    category_id=row.get("category"),
+                    answer=answer,
+                    commentary=commentary,
+                    owner=owner,
+                )
+                for row, answer, commentary in zip(data, answers, commentaries)
+            ],
+            batch_size=batch_size,
+        )
+
+    return {"created": [problem.pk for problem in problems], "errors": errors}
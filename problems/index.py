@@ -0,0 +1,169 @@
+"""
+In-process index of problem sort keys, as compact array columns.
+problem lists are filtered and recommendations are ordered without database.
+refreshed incrementally by change events, see invalidate().
+"""
+import threading
+import time
+from array import array
+
+from django.conf import settings
+
+from config import pubsub
+
+from .models import Problem
+
+# channel of changed problem ids, comma separated.
+INDEX_CHANNEL = "problems.index"
+
+
+def _fetch(ids=None):
+    """(id, level, category_id, submitted, created timestamp) of problems"""
+    problems = Problem.objects.all()
+    if ids is not None:
+        problems = problems.filter(pk__in=ids)  # queryset filter, no delay
+    rows = problems.values_list(
+        "id", "level", "category_id", "stats__submitted_count", "created_at"
+    )
+    return [
+        (id, level, category or 0, submitted or 0, created.timestamp())
+        for id, level, category, submitted, created in rows
+    ]
+
+
+class ProblemIndex:
+    """
+    columns of problems ordered by (created_at, id), same as problem lists.
+    rows are loaded at first use and reloaded every ttl, changed rows are
+    fetched again on next read after invalidated.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._lock = threading.RLock()
+        self._dirty = set()  # ids changed since loaded
+        self._expiry = 0
+        self._subscribed = False
+        self._set_rows([])
+
+    def _set_rows(self, rows):
+        rows.sort(key=lambda row: (row[4], row[0]))
+        self.ids = array("q", (row[0] for row in rows))
+        self.levels = array("b", (row[1] for row in rows))
+        self.categories = array("q", (row[2] for row in rows))  # 0 for none
+        self.submitted = array("q", (row[3] for row in rows))
+        self.created = array("d", (row[4] for row in rows))
+        self._positions = {id: i for i, id in enumerate(self.ids)}
+        self._order = None  # row numbers in recommendation order, lazily
+
+    def _rows(self):
+        return list(
+            zip(self.ids, self.levels, self.categories, self.submitted, self.created)
+        )
+
+    def clear(self):
+        with self._lock:
+            self._expiry = 0
+            self._dirty.clear()
+            self._set_rows([])
+
+    def invalidate(self, ids):
+        """mark ids changed, fetched again on next read"""
+        with self._lock:
+            self._dirty.update(ids)
+
+    def _on_message(self, message):
+        self.invalidate(int(id) for id in message.split(",") if id)
+
+    def _ensure(self):
+        """load, reload after ttl, or fetch changed rows"""
+        if not self._subscribed:
+            pubsub.subscribe(INDEX_CHANNEL, self._on_message)
+            self._subscribed = True
+
+        if time.monotonic() >= self._expiry:
+            self._dirty.clear()
+            self._set_rows(_fetch())
+            self._expiry = time.monotonic() + self.ttl
+            return
+
+        if not self._dirty:
+            return
+
+        dirty, self._dirty = self._dirty, set()
+        fetched = {row[0]: row for row in _fetch(dirty)}
+        if all(id in self._positions and id in fetched for id in dirty):
+            # updated only, in place. created_at never changes.
+            for id, (_, level, category, submitted, _) in fetched.items():
+                i = self._positions[id]
+                self.levels[i], self.categories[i] = level, category
+                self.submitted[i] = submitted
+            self._order = None
+            return
+
+        # created or deleted
+        rows = [row for row in self._rows() if row[0] not in dirty]
+        self._set_rows(rows + list(fetched.values()))
+
+    def filter(self, levels, categories):
+        """ids of problems in levels and categories, ordered by created time"""
+        levels, categories = set(levels), set(categories)
+        with self._lock:
+            self._ensure()
+            return array(
+                "q",
+                (
+                    id
+                    for id, level, category in zip(
+                        self.ids, self.levels, self.categories
+                    )
+                    if (not levels or level in levels)
+                    and (not categories or category and category in categories)
+                ),
+            )
+
+    def recommend(self, limit, levels=(), categories=(), exclude=()):
+        """
+        ids of problems, lowest level, fewest submitted and newest first.
+        same order as Problem.objects.recommend().
+        """
+        levels, categories = set(levels), set(categories)
+        with self._lock:
+            self._ensure()
+            if self._order is None:
+                order = sorted(
+                    range(len(self.ids)),
+                    key=lambda i: (
+                        self.levels[i],
+                        self.submitted[i],
+                        -self.created[i],
+                        -self.ids[i],
+                    ),
+                )
+                self._order = array("q", order)
+
+            ids = []
+            for i in self._order:
+                if len(ids) >= limit:
+                    break
+                if levels and self.levels[i] not in levels:
+                    continue
+                if categories and not (
+                    self.categories[i] and self.categories[i] in categories
+                ):
+                    continue
+                if self.ids[i] not in exclude:
+                    ids.append(self.ids[i])
+            return ids
+
+
+problem_index = ProblemIndex(settings.PROBLEM_INDEX_TTL)
+
+
+def invalidate(ids):
+    """mark problems changed in index of this and other processes"""
+    ids = list(ids)
+    if not ids:
+        return
+    problem_index.invalidate(ids)
+    pubsub.publish(INDEX_CHANNEL, ",".join(map(str, ids)))
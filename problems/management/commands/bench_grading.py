@@ -0,0 +1,111 @@
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test.utils import override_settings
+
+from config import metrics
+from problems.models import Problem, Solution, Submission
+from problems.tasks import check_answer_and_update_score, grade_pending_solutions
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare grading throughput of per solution task and batch task, "
+        "of own solutions in rolled back transaction and cache keys of own "
+        "prefix, cleared before each. events are not published to clients. "
+        "broker overhead is not included."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--solutions", type=int, default=500)
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=100,
+            help="solutions per batch task",
+        )
+
+    def _pending(self, n):
+        """n new solutions of first user, half correct, [(problem_id, solution_id)]"""
+        user = User.objects.first()
+        problems = list(Problem.objects.select_related("answer").order_by("id")[:50])
+        if user is None or not problems:
+            raise CommandError("needs a user and problems.")
+
+        Problem.objects.get_cached_snapshots([p.pk for p in problems])  # warm
+        submissions = [
+            Submission.objects.get_or_create(user=user, problem=problem)[0]
+            for problem in problems
+        ]
+        solutions = Solution.objects.bulk_create(
+            [
+                Solution(
+                    submission=submissions[i % len(problems)],
+                    answer=problems[i % len(problems)].answer.answer if i % 2 else "",
+                )
+                for i in range(n)
+            ]
+        )
+        return [(s.submission.problem_id, s.pk) for s in solutions]
+
+    def _measure(self, grade, n):
+        """solutions per second of grade(pending) -> graded, rolled back"""
+        try:
+            with transaction.atomic():
+                pending = self._pending(n)
+                start = time.perf_counter()
+                graded = grade(pending)
+                elapsed = time.perf_counter() - start
+                raise Rollback
+        except Rollback:
+            pass
+        return graded / elapsed
+
+    def handle(self, *args, **options):
+        n, batch_size = options["solutions"], options["batch_size"]
+
+        def _per_task(pending):
+            for problem_id, solution_id in pending:
+                check_answer_and_update_score(problem_id, solution_id)
+            return len(pending)
+
+        def _batch(pending):
+            # own solutions only, never real pending ones.
+            ids = [solution_id for _, solution_id in pending]
+            graded = total = grade_pending_solutions(batch_size, ids)
+            while graded:
+                graded = grade_pending_solutions(batch_size, ids)
+                total += graded
+            return total
+
+        # states and memos of rolled back solutions are not left in cache,
+        # ids are reused. memos of first run are not hit by second.
+        # events are published in process, not to clients. metrics not recorded.
+        caches = {
+            alias: {**config, "KEY_PREFIX": "bench"}
+            for alias, config in settings.CACHES.items()
+        }
+        results = []
+        enabled, metrics.ENABLED = metrics.ENABLED, False
+        try:
+            with override_settings(
+                DEBUG_PROBLEM_CHECK_DELAY=0, CACHES=caches, PUBSUB_BACKEND="local"
+            ):
+                for name, grade in [("per task", _per_task), ("batch", _batch)]:
+                    cache.delete_pattern("*")
+                    results.append((name, self._measure(grade, n)))
+                cache.delete_pattern("*")
+        finally:
+            metrics.ENABLED = enabled
+
+        self.stdout.write(f"{n} solutions, batch size {batch_size}")
+        for name, rate in results:
+            self.stdout.write(f"{name:<10} {rate:10.1f} solutions/s")
@@ -0,0 +1,71 @@
+import time
+
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from config.renderers import FastJSONRenderer
+from problems.models import Problem
+from problems.serializers import ProblemListSerializer, ProblemSnapshotSerializer
+
+
+def _per_row(func, rows, repeat):
+    """best microseconds per row of func() in repeat runs"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best / max(rows, 1) * 10**6
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare per row cost of problem list rows and rendering. "
+        "'snapshots' is the path of list page and indexed recommendation, "
+        "'values' of recommendation without index(PROBLEM_INDEX_ENABLED=False), "
+        "'serializer' of model instances before them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--rows",
+            type=int,
+            default=1000,
+            help="problems per run, at most existing problems",
+        )
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def handle(self, *args, **options):
+        problems = Problem.objects.with_counts()[: options["rows"]]
+        rows = problems.count()
+        repeat = options["repeat"]
+
+        ids = list(problems.values_list("id", flat=True))
+        Problem.objects.get_cached_snapshots(ids)  # warm, as served
+
+        def _snapshots():
+            return [
+                ProblemSnapshotSerializer.list_representation(s)
+                for s in Problem.objects.get_cached_snapshots(ids)
+            ]
+
+        def _serializer():
+            return ProblemListSerializer(list(problems), many=True).data
+
+        def _values():
+            return [
+                ProblemListSerializer.from_values(r) for r in problems.list_values()
+            ]
+
+        data = _values()
+        results = [
+            ("snapshots", _snapshots),
+            ("serializer", _serializer),
+            ("values", _values),
+            ("render json", lambda: JSONRenderer().render(data)),
+            ("render fast", lambda: FastJSONRenderer().render(data)),
+        ]
+
+        self.stdout.write(f"{rows} rows, best of {repeat}")
+        for name, func in results:
+            self.stdout.write(f"{name:<12} {_per_row(func, rows, repeat):8.2f} us/row")
@@ -0,0 +1,76 @@
+from django.core.management.base import BaseCommand
+from django_redis import get_redis_connection
+
+from config import metrics
+
+COLUMNS = (
+    "local_hits",
+    "hits",
+    "misses",
+    "stale_hits",
+    "tombstone_hits",
+    "sets",
+    "invalidations",
+    "local_evictions",
+    "bytes_read",
+    "bytes_written",
+)
+
+
+class Command(BaseCommand):
+    help = "Show cache metrics by key family, aggregated over all processes."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--prometheus",
+            action="store_true",
+            help="print in prometheus text format",
+        )
+        parser.add_argument(
+            "--reset",
+            action="store_true",
+            help="delete aggregated metrics after print",
+        )
+
+    def handle(self, *args, **options):
+        metrics.flush()  # this process
+        fields = metrics.aggregated()
+
+        if options["prometheus"]:
+            self.stdout.write(metrics.prometheus(fields))
+        else:
+            self._print_table(fields)
+
+        if options["reset"]:
+            get_redis_connection("default").delete(metrics.METRICS_KEY)
+
+    def _print_table(self, fields):
+        families = sorted({field.split("|")[0] for field in fields})
+
+        header = ["family", *COLUMNS, "hit_ratio", "get_p50_ms", "get_p95_ms"]
+        rows = [header]
+        for family in families:
+            values = [fields.get(f"{family}|{name}", 0) for name in COLUMNS]
+            counts = dict(zip(COLUMNS, values))
+            hits = counts["local_hits"] + counts["hits"]
+            total = hits + counts["misses"]
+            rows.append(
+                [
+                    family,
+                    *(f"{value:.0f}" for value in values),
+                    f"{hits / total:.2%}" if total else "-",
+                    str(metrics.percentile(fields, family, "get", 0.5) or "-"),
+                    str(metrics.percentile(fields, family, "get", 0.95) or "-"),
+                ]
+            )
+
+        widths = [max(len(row[i]) for row in rows) for i in range(len(header))]
+        for row in rows:
+            self.stdout.write("  ".join(v.ljust(w) for v, w in zip(row, widths)))
+
+        # evictions by redis maxmemory policy
+        info = get_redis_connection("default").info("stats")
+        names = ("evicted_keys", "expired_keys", "keyspace_hits", "keyspace_misses")
+        self.stdout.write(
+            "\nredis " + " ".join(f"{name}={info.get(name)}" for name in names)
+        )
@@ -0,0 +1,51 @@
+import json
+import sys
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from problems import imports
+
+
+class Command(BaseCommand):
+    help = "Import problems from JSON array or NDJSON file, in single transaction."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="file of problems, '-' for stdin")
+        parser.add_argument(
+            "--owner",
+            required=True,
+            help="username of owner of imported problems",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=settings.PROBLEM_IMPORT_BATCH_SIZE,
+            help="rows per INSERT",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            owner = User.objects.get(username=options["owner"])
+        except User.DoesNotExist:
+            raise CommandError(f"no user '{options['owner']}'.")
+
+        try:
+            if options["path"] == "-":
+                rows = imports.parse(sys.stdin)
+            else:
+                with open(options["path"], encoding="utf-8") as stream:
+                    rows = imports.parse(stream)
+        except (OSError, ValueError) as exc:
+            raise CommandError(f"cannot read problems, {exc}")
+
+        report = imports.import_problems(rows, owner, options["batch_size"])
+        for error in report["errors"]:
+            self.stderr.write(f"row {error['row']}: {json.dumps(error['errors'])}")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"imported {len(report['created'])} problems, "
+                f"{len(report['errors'])} errors"
+            )
+        )
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from problems.models import ProblemStats
+from problems.signals import evict_problems
+
+
+class Command(BaseCommand):
+    help = "Recompute submission counters of problems from submissions."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="rows per bulk query",
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            ids = ProblemStats.objects.reconcile(options["batch_size"])
+            # bulk queries send no signals
+            transaction.on_commit(lambda: evict_problems(ids))
+
+        self.stdout.write(self.style.SUCCESS(f"reconciled {len(ids)} problems"))
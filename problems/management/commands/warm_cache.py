@@ -0,0 +1,46 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from problems import warmup
+
+
+class Command(BaseCommand):
+    help = "Preload problem snapshots and popular problem lists into cache."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=settings.CACHE_WARMUP_CHUNK_SIZE,
+            help="problems per query and redis pipeline",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=settings.CACHE_WARMUP_CONCURRENCY,
+            help="max threads querying database at once",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="print estimated redis memory, without writing",
+        )
+
+    def handle(self, *args, **options):
+        if options["dry_run"]:
+            report = warmup.estimate(options["chunk_size"])
+            self.stdout.write(
+                "problems {problems} x {problem_bytes} B = {problems_bytes} B\n"
+                "lists {lists} = {lists_bytes} B\n"
+                "total {total_bytes} B ({mib:.2f} MiB)".format(
+                    mib=report["total_bytes"] / 2**20, **report
+                )
+            )
+            return
+
+        report = warmup.warm(options["chunk_size"], options["concurrency"])
+        self.stdout.write(
+            self.style.SUCCESS(
+                "warmed {problems} problems, {lists} lists".format(**report)
+            )
+        )
@@ -0,0 +1,64 @@
+# Generated by Django 4.1.7 on 2026-10-17 01:11
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_stats(apps, schema_editor):
+    """counters of existing problems from submissions"""
+    Problem = apps.get_model("problems", "Problem")
+    ProblemStats = apps.get_model("problems", "ProblemStats")
+    Submission = apps.get_model("problems", "Submission")
+
+    counts = {
+        row["problem_id"]: (row["submitted"], row["solved"])
+        for row in Submission.objects.values("problem_id").annotate(
+            submitted=models.Count("id"),
+            solved=models.Count("id", filter=models.Q(score=100)),
+        )
+    }
+    rows = ProblemStats.objects.in_bulk()
+
+    created, updated = [], []
+    for problem_id in Problem.objects.values_list("id", flat=True):
+        submitted, solved = counts.get(problem_id, (0, 0))
+        row = rows.get(problem_id)
+        if row is None:
+            row = ProblemStats(problem_id=problem_id)
+            created.append(row)
+        else:
+            updated.append(row)
+        row.submitted_count, row.solved_count = submitted, solved
+
+    ProblemStats.objects.bulk_create(created, batch_size=500)
+    ProblemStats.objects.bulk_update(
+        updated, ["submitted_count", "solved_count"], batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("problems", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ProblemStats",
+            fields=[
+                (
+                    "problem",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="stats",
+                        serialize=False,
+                        to="problems.problem",
+                    ),
+                ),
+                ("submitted_count", models.PositiveIntegerField(default=0)),
+                ("solved_count", models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(backfill_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 4.1.7 on 2026-10-17 01:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("problems", "0002_problemstats"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="problem",
+            index=models.Index(
+                fields=["level", "category", "created_at"],
+                name="problem_level_category_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="problem",
+            index=models.Index(fields=["created_at", "id"], name="problem_created_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="problem",
+            index=models.Index(
+                fields=["level", "-created_at"], name="problem_level_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="solution",
+            index=models.Index(
+                fields=["submission", "-created_at"], name="solution_history_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="submission",
+            index=models.Index(
+                fields=["problem", "score"], name="submission_problem_score_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="submission",
+            index=models.Index(
+                fields=["user", "score"], name="submission_user_score_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 4.1.7 on 2026-10-17 01:28
+
+import hashlib
+
+from django.db import migrations, models
+
+
+def digest_answers(apps, schema_editor):
+    """digests of existing answers, 'exact' policy as before"""
+    Answer = apps.get_model("problems", "Answer")
+    answers = list(Answer.objects.all())
+    for answer in answers:
+        text = f"exact\0{answer.answer}"
+        answer.digest = hashlib.sha256(text.encode()).hexdigest()
+        answer.version = 1
+    Answer.objects.bulk_update(answers, ["digest", "version"], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("problems", "0003_composite_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="answer",
+            name="digest",
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name="answer",
+            name="normalization",
+            field=models.CharField(
+                choices=[
+                    ("exact", "Exact"),
+                    ("line_endings", "Line Endings"),
+                    ("whitespace", "Whitespace"),
+                ],
+                default="exact",
+                max_length=12,
+            ),
+        ),
+        migrations.AddField(
+            model_name="answer",
+            name="version",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="solution",
+            name="answer_version",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="solution",
+            name="digest",
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.RunPython(digest_answers, migrations.RunPython.noop),
+    ]
@@ -1,10 +1,22 @@
-from django.db import models
+import hashlib
+import json
+import re
+from array import array
+from datetime import timedelta
+
+from django.db import models, transaction
+from django.db.models import QuerySet
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import User
+from django.conf import settings
+from django.utils import timezone
 
-from config import redis  # custom redis interface
+from config import pubsub, redis  # custom redis interface
 
 from .models_abstract import (
     DelayManager,
+    SignalingManager,
+    SignalingQuerySet,
     AutoTimeTrackingModelBase,
     AnswerModelBase,
     ScoreModelBase,
@@ -15,55 +27,122 @@ from .models_abstract import (
 
 SEPARATOR = ","
 
+
+def parse_values(value: str) -> list:
+    """
+    parse comma separated integers into sorted unique list.
+    '2, 1,2' -> [1, 2]
+    can raise ValueError
+    """
+    return sorted({int(item) for item in value.split(SEPARATOR) if item.strip()})
+
+
 # use .format()
 PROBLEM_KEY = "problems.{}"
+# generation of problem lists, use .format() with 'level.1', 'category.1' or 'all'
+GENERATION_KEY = "problems.generation.{}"
+# version of problem, bumped on every change of problem and related models
+VERSION_KEY = "problems.version.{}"
+# version of categories
+CATEGORIES_VERSION_KEY = "categories.version"
+# solved problem ids of user, redis set.
+SOLVED_KEY = "solved.{}"
+# bumped on every solve of user, guards population of solved set.
+SOLVED_GENERATION_KEY = "solved.generation.{}"
+# (user id, problem id, solution) while grading, polled without database.
+SOLUTION_KEY = "solutions.{}"
+# grading states of solutions pushed to clients, json lines of events.
+SOLUTION_EVENTS_CHANNEL = "solutions.events"
+# score of answer digest, use .format(problem_id, answer version, digest)
+VERDICT_KEY = "verdicts.{}.{}.{}"
+
+
+def _groups_query(levels, categories):
+    """Q of problems in levels and categories, empty means all"""
+    query = models.Q()
+    if levels:
+        query &= models.Q(level__in=levels)
+    if categories:
+        query &= models.Q(category__in=categories)
+    return query
+
+
+def _generation_keys(levels, categories):
+    """generation keys which problem list filtered by levels and categories"""
+    keys = [GENERATION_KEY.format(f"level.{level}") for level in levels]
+    keys += [GENERATION_KEY.format(f"category.{id}") for id in categories]
+    return keys if keys else [GENERATION_KEY.format("all")]
 
 
-def update_problem_cache(obj):
-    """update cache if object is related model with problem"""
-    if not hasattr(obj, "problem"):
-        return
+class Answer(AnswerModelBase):
+    """Problem answer model, submit by problem owner"""
 
-    pk = obj.problem.pk
-    key = PROBLEM_KEY.format(pk)
+    class Normalization(models.TextChoices):
+        """how answers are compared, policy of problem"""
 
-    hit = redis.get(key)
-    if hit:
-        # update cache
-        redis.set(key, obj.problem)
+        EXACT = ("exact", "Exact")
+        # CRLF and CR as LF, trailing spaces of lines and trailing lines ignored
+        LINE_ENDINGS = ("line_endings", "Line Endings")
+        # every run of whitespace as single space, stripped
+        WHITESPACE = ("whitespace", "Whitespace")
 
+    objects = SignalingManager()
 
-class Answer(AnswerModelBase):
-    """Problem answer model, submit by problem owner"""
+    normalization = models.CharField(
+        max_length=12,
+        choices=Normalization.choices,
+        default=Normalization.EXACT,
+    )
+    # sha256 of normalized answer, solutions are graded by digest only.
+    digest = models.CharField(max_length=64, blank=True, editable=False)
+    # increased when digest changed, memoized verdicts of old version are unused.
+    version = models.PositiveIntegerField(default=0, editable=False)
+
+    @staticmethod
+    def digest_of(text, normalization) -> str:
+        """digest of text normalized by normalization policy"""
+        if normalization == Answer.Normalization.LINE_ENDINGS:
+            lines = re.split(r"\r\n|\r|\n", text)
+            text = "\n".join(line.rstrip() for line in lines).rstrip("\n")
+        elif normalization == Answer.Normalization.WHITESPACE:
+            text = " ".join(text.split())
+        # policy is digested too, changed policy changes digest.
+        return hashlib.sha256(f"{normalization}\0{text}".encode()).hexdigest()
+
+    def update_digest(self):
+        """set digest of answer, and increase version if changed"""
+        digest = self.digest_of(self.answer, self.normalization)
+        if digest != self.digest:
+            self.digest = digest
+            self.version += 1
+
+    def save(self, *args, **kwargs):
+        self.update_digest()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None:
+            kwargs["update_fields"] = {*update_fields, "digest", "version"}
+        super().save(*args, **kwargs)
 
     def __str__(self) -> str:
         return f"answer of {self.problem}" if hasattr(self, "problem") else "deleted"
 
-    def save(
-        self, force_insert=False, force_update=False, using=None, update_fields=None
-    ):
-        super().save(force_insert, force_update, using, update_fields)
-        update_problem_cache(self)
-
 
 class Commentary(AutoTimeTrackingModelBase):
     """Problem Commentary model, submit by problem owner"""
 
+    objects = SignalingManager()
+
     comment = models.TextField()
 
     def __str__(self) -> str:
         return f"comment of {self.problem}" if hasattr(self, "problem") else "deleted"
 
-    def save(
-        self, force_insert=False, force_update=False, using=None, update_fields=None
-    ):
-        super().save(force_insert, force_update, using, update_fields)
-        update_problem_cache(self)
-
 
 class Category(AutoTimeTrackingModelBase):
     """Category of Problem model definition"""
 
+    objects = SignalingManager()
+
     name = models.CharField(
         max_length=50,
         unique=True,
@@ -73,55 +152,177 @@ class Category(AutoTimeTrackingModelBase):
         return f"{self.name}"
 
 
-class ProblemManager(DelayManager):
+class ProblemQuerySet(SignalingQuerySet):
+    def with_counts(self):
+        """
+        problems with owner, category and counts of submissions from stats,
+        in single query. counts are 'num_submitted' and 'num_solved'.
+        """
+        return self.select_related("owner", "category").annotate(
+            num_submitted=Coalesce("stats__submitted_count", 0),
+            num_solved=Coalesce("stats__solved_count", 0),
+        )
+
+    def list_values(self):
+        """
+        dicts of columns of list representation only, no model instances.
+        use after with_counts(), see ProblemListSerializer.from_values().
+        """
+        return self.values(
+            "id",
+            "name",
+            "level",
+            "category__name",
+            "owner__username",
+            "num_submitted",
+            "num_solved",
+        )
+
+
+class ProblemManager(DelayManager.from_queryset(ProblemQuerySet)):
     """
     Problem model manager
     do queries.
     """
 
-    def get_cached_queryset(self, levels=str, categories=str):
-        """cached"""
+    def filter_by_groups(self, levels: list, categories: list):
+        """problems filtered by levels and categories, empty means all"""
+        # TODO : query with rate of solved
+        return self.filter(_groups_query(levels, categories))
+
+    def recommend(self, limit=1, levels=(), categories=(), exclude=()):
+        """
+        problems to recommend in single query, lowest level, fewest submitted
+        and newest first. exclude : ids, solved problems of user.
+        """
+        queryset = self.with_counts().filter(_groups_query(levels, categories))
+        if exclude:
+            queryset = queryset.exclude(pk__in=exclude)
+
+        order = ("level", "num_submitted", "-created_at", "-id")
+        return queryset.order_by(*order)[:limit]
+
+    def page_after(self, levels, categories, cursor, size):
+        """
+        (id, created_at) of problems in list order after cursor,
+        keyset pagination. cursor : (created_at, id) of last row or None.
+        cost does not grow with depth of page.
+        """
+        queryset = self.all().filter(_groups_query(levels, categories))
+        if cursor is not None:
+            created_at, id = cursor
+            queryset = queryset.filter(
+                models.Q(created_at__gt=created_at)
+                | models.Q(created_at=created_at, id__gt=id)
+            )
+        rows = queryset.order_by("created_at", "id").values_list("id", "created_at")
+        return list(rows[:size])
+
+    def _list_key(self, levels, categories, name=""):
+        """key of cached value of list, changed when problems in list changed"""
+        generation_keys = _generation_keys(levels, categories)
+        generations = redis.get_many(generation_keys)
+        generation = ".".join(str(generations.get(k, 0)) for k in generation_keys)
+
+        return PROBLEM_KEY.format(
+            "{}levels={}.categories={}.generation={}".format(
+                name,
+                SEPARATOR.join(map(str, levels)),
+                SEPARATOR.join(map(str, categories)),
+                generation,
+            )
+        )
 
-        def _list_queries(field_name, values: list) -> models.Q:
-            query = models.Q()
-            for value in values:
-                query |= models.Q(**{field_name: value})
-            return query
+    def get_cached_count(self, levels: list, categories: list) -> int:
+        """cached count of problems filtered by levels and categories"""
+        key = self._list_key(levels, categories, "count.")
+        return redis.get_or_compute(
+            key,
+            lambda: self.all().filter(_groups_query(levels, categories)).count(),
+            settings.DEBUG_REDIS_QUERY_TTL,
+        )
 
-        assert isinstance(levels, str) or isinstance(
-            categories, str
-        ), "pass comma separated value"
+    def get_cached_ids(self, levels: list, categories: list):
+        """
+        cached ids of problems filtered by levels and categories,
+        ordered by created time. pass values parsed by parse_values.
+        """
+        # generations are bumped when problems in the list changed.
+        key = self._list_key(levels, categories)
+
+        def _load():
+            queryset = self.filter_by_groups(levels, categories)
+            ids = queryset.order_by("created_at", "id").values_list("id", flat=True)
+            ids = array("q", ids)
+            if not ids:
+                # tombstone, short ttl for arbitrary filters matching nothing
+                raise self.model.DoesNotExist
+            return ids
 
-        # TODO : unique key, sort levels value when not sorted.
-        key = PROBLEM_KEY.format(f"levels={levels}.categories={categories}")
+        try:
+            return redis.get_or_compute(
+                key,
+                _load,
+                settings.DEBUG_REDIS_QUERY_TTL,
+                missing=self.model.DoesNotExist,
+            )
+        except self.model.DoesNotExist:
+            return array("q")
+
+    def aggregated(self):
+        """problems with answer, commentary, owner, category and counts"""
+        return self.with_counts().select_related("answer", "commentary")
+
+    def get_snapshot(self, id) -> dict:
+        """
+        materialized problem as plain dict, see ProblemSnapshotSerializer.
+        can raise Problem.DoesNotExist
+        """
+        from .serializers import ProblemSnapshotSerializer
 
-        hit = redis.get(key)
-        if not hit:
-            # TODO : error fix
-            query = models.Q()
-            if levels:
-                query &= models.Q(_list_queries("level", levels.split(SEPARATOR)))
-            if categories:
-                query &= _list_queries("category", categories.split(SEPARATOR))
-            # TODO : query with rate of solved
+        return ProblemSnapshotSerializer.to_snapshot(self.aggregated().get(pk=id))
 
-            hit = self.filter(query)
-            redis.set(key, hit)
+    def load_snapshots(self, ids) -> dict:
+        """snapshots of problems of ids in single query, {id: snapshot}"""
+        from .serializers import ProblemSnapshotSerializer
 
-        return hit
+        problems = self.aggregated().filter(pk__in=ids)
+        return {
+            problem.pk: ProblemSnapshotSerializer.to_snapshot(problem)
+            for problem in problems
+        }
 
-    def get_cached_problem(self, id):
+    def get_cached_snapshots(self, ids):
         """
-        get problem using cache, 'look aside'
+        get snapshots of problems of ids using cache with single round trip,
+        missed problems are queried at once. keep order of ids.
+        not existing problems are omitted.
         """
-        key = PROBLEM_KEY.format(id)
-        hit = redis.get(key)
+        keys = {PROBLEM_KEY.format(id): id for id in ids}
 
-        if not hit:
-            hit = self.get(pk=id)
-            redis.set(key, hit)
+        def _load(missed):
+            snapshots = self.load_snapshots([keys[key] for key in missed])
+            return {PROBLEM_KEY.format(id): value for id, value in snapshots.items()}
 
-        return hit
+        hits = redis.get_or_compute_many_local(
+            list(keys), _load, settings.DEBUG_REDIS_PROBLEM_TTL
+        )
+        return [hits[key] for key in keys if key in hits]
+
+    def get_cached_snapshot(self, id) -> dict:
+        """
+        get problem snapshot using cache, 'look aside'
+        local cache -> redis -> database
+        not existing problem is cached as tombstone.
+        can raise Problem.DoesNotExist
+        """
+        key = PROBLEM_KEY.format(id)
+        return redis.get_or_compute_local(
+            key,
+            lambda: self.get_snapshot(id),
+            settings.DEBUG_REDIS_PROBLEM_TTL,
+            missing=self.model.DoesNotExist,
+        )
 
     def check_answer(self, problem_id, answer):
         """
@@ -138,12 +339,25 @@ class Problem(AutoTimeTrackingModelBase):
 
     objects = ProblemManager()
 
+    # values before QuerySet.update(), for post_bulk_update
+    tracked_fields = ("level", "category_id")
+
     class Meta:
         constraints = [
             models.CheckConstraint(
                 check=models.Q(level__gte=1, level__lte=5), name="level_range"
             ),
         ]
+        indexes = [
+            # lists, filtered by groups and ordered by created time
+            models.Index(
+                fields=["level", "category", "created_at"],
+                name="problem_level_category_idx",
+            ),
+            models.Index(fields=["created_at", "id"], name="problem_created_idx"),
+            # recommendation order
+            models.Index(fields=["level", "-created_at"], name="problem_level_idx"),
+        ]
 
     # name of this problem.
     name = models.CharField(max_length=50, unique=True)
@@ -177,6 +391,16 @@ class Problem(AutoTimeTrackingModelBase):
         related_name="own_problems",
     )
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_group = instance._list_group()
+        return instance
+
+    def _list_group(self):
+        """(level, category_id) which decide problem lists including this"""
+        return (self.__dict__.get("level"), self.__dict__.get("category_id"))
+
     def submitted_count(self):
         return self.submissions.all().count()
 
@@ -186,18 +410,102 @@ class Problem(AutoTimeTrackingModelBase):
     def __str__(self) -> str:
         return f"{self.name}"
 
-    def save(
-        self, force_insert=False, force_update=False, using=None, update_fields=None
-    ) -> None:
-        super().save(force_insert, force_update, using, update_fields)
 
-        pk = self.pk
-        key = PROBLEM_KEY.format(pk)
+class ProblemStatsManager(SignalingManager):
+    def incr(self, problem_id, submitted=0, solved=0):
+        """
+        add to counters with atomic UPDATE, row is created on first use.
+        plain queryset, no signal to refresh and re-version whole problem.
+        counts of cached snapshot are patched on commit, see cache_counts.
+        """
+        values = {
+            "submitted_count": models.F("submitted_count") + submitted,
+            "solved_count": models.F("solved_count") + solved,
+        }
+        stats = QuerySet(self.model).filter(problem_id=problem_id)
+        if not stats.update(**values):
+            QuerySet(self.model).bulk_create(
+                [self.model(problem_id=problem_id)], ignore_conflicts=True
+            )
+            stats.update(**values)
+
+        # row is locked by update until commit, counts are ours.
+        counts = stats.values_list("submitted_count", "solved_count").first()
+        if counts is not None:
+            transaction.on_commit(lambda: self.cache_counts(problem_id, *counts))
+
+    def cache_counts(self, problem_id, submitted, solved):
+        """
+        set counts of cached snapshot of problem, nothing if not cached.
+        version is not bumped, responses and local caches of other processes
+        keep old counts until their short ttl.
+        """
+        redis.patch(
+            PROBLEM_KEY.format(problem_id),
+            {
+                "submitted_count": submitted,
+                "solved_count": solved,
+                "acceptance_rate": solved / submitted if submitted else 0.0,
+            },
+        )
 
-        hit = redis.get(key)
-        if hit:
-            # update cache
-            redis.set(key, self)
+    def reconcile(self, batch_size=500):
+        """
+        recompute counters of every problem from submissions in bulk.
+        returns ids of problems which counters were drifted.
+        """
+        counts = {
+            row["problem_id"]: (row["submitted"], row["solved"])
+            for row in Submission.objects.values("problem_id").annotate(
+                submitted=models.Count("id"),
+                solved=models.Count("id", filter=models.Q(score=100)),
+            )
+        }
+        stats = self.in_bulk()
+
+        created, updated = [], []
+        for problem_id in Problem.objects.values_list("id", flat=True):
+            submitted, solved = counts.get(problem_id, (0, 0))
+            row = stats.get(problem_id)
+            if row is None:
+                created.append(self.model(problem_id=problem_id))
+                row = created[-1]
+            elif (row.submitted_count, row.solved_count) == (submitted, solved):
+                continue
+            else:
+                updated.append(row)
+            row.submitted_count, row.solved_count = submitted, solved
+
+        self.bulk_create(created, batch_size=batch_size)
+        self.bulk_update(
+            updated, ["submitted_count", "solved_count"], batch_size=batch_size
+        )
+        return [row.problem_id for row in created + updated]
+
+
+class ProblemStats(models.Model):
+    """
+    Denormalized submission counters of problem,
+    incremented when submission is created and first solved.
+    """
+
+    objects = ProblemStatsManager()
+
+    problem = models.OneToOneField(
+        Problem,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="stats",
+    )
+    submitted_count = models.PositiveIntegerField(default=0)
+    solved_count = models.PositiveIntegerField(default=0)
+
+    @property
+    def acceptance_rate(self) -> float:
+        return self.solved_count / self.submitted_count if self.submitted_count else 0.0
+
+    def __str__(self) -> str:
+        return f"stats of {self.problem_id}"
 
 
 class SubmissionManager(models.Manager):
@@ -208,6 +516,32 @@ class SubmissionManager(models.Manager):
         """
         return self.get(models.Q(problem=problem_id) & models.Q(user=user.id))
 
+    def solved_problem_ids(self, user) -> set:
+        """ids of problems which user solved, cached as redis set"""
+        key = SOLVED_KEY.format(user.pk)
+        ids = redis.get_set(key)
+        if ids is None:
+            # read before query, rows missing solve committed meanwhile
+            # are not cached, add_solved could not add to set not existed.
+            generation_key = SOLVED_GENERATION_KEY.format(user.pk)
+            generation = redis.get_generation(generation_key)
+            solved = self.filter(user=user, score=100)
+            ids = set(solved.values_list("problem_id", flat=True))
+            redis.set_set(
+                key, ids, settings.SOLVED_SET_TTL, guard=(generation_key, generation)
+            )
+        return ids
+
+    def add_solved(self, user_id, problem_id):
+        """
+        add to cached solved set of user, call when submission first solved.
+        on commit, so that sets loaded before are not cached.
+        """
+        redis.bump_generation(
+            SOLVED_GENERATION_KEY.format(user_id), settings.SOLVED_SET_TTL
+        )
+        redis.add_to_set(SOLVED_KEY.format(user_id), problem_id)
+
 
 class Submission(
     AutoTimeTrackingModelBase,
@@ -228,6 +562,14 @@ class Submission(
             ),
             ScoreModelBase.get_score_constraints("submission"),
         ]
+        indexes = [
+            # counts and solvers of problem
+            models.Index(
+                fields=["problem", "score"], name="submission_problem_score_idx"
+            ),
+            # solved problems of user
+            models.Index(fields=["user", "score"], name="submission_user_score_idx"),
+        ]
 
     # user who submit
     user = models.ForeignKey(
@@ -259,6 +601,226 @@ class SolutionManager(models.Manager):
 
         return self.filter(submission=submission).order_by("-created_at")
 
+    def history(self, problem_id, user, cursor=None, limit=None):
+        """
+        solutions of problem which user submitted, latest first.
+        keyset pagination, cursor : (created_at, id) of last row or None.
+        """
+        limit = limit if limit else settings.SOLUTION_HISTORY_PAGE_SIZE
+        solutions = self.filter(
+            submission__problem=problem_id, submission__user=user.id
+        )
+        if cursor is not None:
+            created_at, id = cursor
+            solutions = solutions.filter(
+                models.Q(created_at__lt=created_at)
+                | models.Q(created_at=created_at, id__lt=id)
+            )
+        return list(solutions.order_by("-created_at", "-id")[:limit])
+
+    @staticmethod
+    def _claimable(now):
+        """Q of pending solutions, or checking longer than GRADING_CLAIM_TIMEOUT"""
+        stale = now - timedelta(seconds=settings.GRADING_CLAIM_TIMEOUT)
+        return models.Q(state=Solution.CHECK_BEFORE) | models.Q(
+            state=Solution.CHEKING, updated_at__lt=stale
+        )
+
+    def claim(self, solution_id):
+        """
+        mark solution checking by single conditional update, if pending or
+        checking longer than GRADING_CLAIM_TIMEOUT(worker gone).
+        True for only one of concurrent or redelivered gradings.
+        """
+        now = timezone.now()
+        return bool(
+            self.filter(self._claimable(now), pk=solution_id).update(
+                state=Solution.CHEKING, updated_at=now
+            )
+        )
+
+    def claim_pending(self, limit, solution_ids=None):
+        """
+        claim() of up to limit solutions, oldest first, by single conditional
+        update. claim time marks rows of this claim, rows claimed by other
+        worker meanwhile are not returned. returns solutions with submission.
+        solution_ids : claim among these only, None for any.
+        """
+        now = timezone.now()
+        claimable = self._claimable(now)
+        pending = self.filter(claimable)
+        if solution_ids is not None:
+            pending = pending.filter(pk__in=solution_ids)
+        ids = list(pending.order_by("id").values_list("pk", flat=True)[:limit])
+        if not ids:
+            return []
+        self.filter(claimable, pk__in=ids).update(
+            state=Solution.CHEKING, updated_at=now
+        )
+        claimed = self.filter(pk__in=ids, state=Solution.CHEKING, updated_at=now)
+        return list(claimed.select_related("submission").order_by("id"))
+
+    def release(self, *solution_ids):
+        """back to pending, for claimed grading failed to be retried"""
+        self.filter(pk__in=solution_ids, state=Solution.CHEKING).update(
+            state=Solution.CHECK_BEFORE
+        )
+
+    def finish(self, solution):
+        """
+        write graded solution as done by single conditional update.
+        False if done already, by other grading.
+        """
+        solution.state = Solution.CHECK_DONE
+        solution.updated_at = timezone.now()
+        return bool(
+            self.filter(pk=solution.pk)
+            .exclude(state=Solution.CHECK_DONE)
+            .update(
+                score=solution.score,
+                state=solution.state,
+                digest=solution.digest,
+                answer_version=solution.answer_version,
+                updated_at=solution.updated_at,
+            )
+        )
+
+    def finish_many(self, solutions):
+        """
+        finish() of graded solutions with bulk_update, only rows not done yet.
+        returns finished ones. call in transaction.
+        """
+        undone = self.filter(pk__in=[s.pk for s in solutions]).exclude(
+            state=Solution.CHECK_DONE
+        )
+        ids = set(undone.select_for_update().values_list("pk", flat=True))
+        finished = [s for s in solutions if s.pk in ids]
+
+        now = timezone.now()
+        for solution in finished:
+            solution.state = Solution.CHECK_DONE
+            solution.updated_at = now
+        undone.bulk_update(
+            finished, ["score", "state", "digest", "answer_version", "updated_at"]
+        )
+        return finished
+
+    def cache_state(self, solution):
+        """
+        cache solution with its grading state, polled without database.
+        call with submission of solution loaded.
+        """
+        self.cache_states([solution])
+
+    def cache_states(self, solutions):
+        """
+        cache_state of solutions in single round trip,
+        and publish their states to waiting clients in single message.
+        """
+        entries = {
+            SOLUTION_KEY.format(solution.pk): (
+                solution.submission.user_id,
+                solution.submission.problem_id,
+                solution,
+            )
+            for solution in solutions
+        }
+        redis.set_many(entries, settings.SOLUTION_STATE_TTL)
+        if solutions:
+            pubsub.publish(
+                SOLUTION_EVENTS_CHANNEL,
+                "\n".join(json.dumps(self.event(s)) for s in solutions),
+            )
+
+    @staticmethod
+    def event(solution):
+        """grading state of solution, pushed to clients"""
+        return {"id": solution.pk, "state": solution.state, "score": solution.score}
+
+    def get_cached_state(self, problem_id, solution_id, user):
+        """cached solution, None if not cached or not of user and problem"""
+        entry = redis.get(SOLUTION_KEY.format(solution_id))
+        if entry is None:
+            return None
+        user_id, cached_problem_id, solution = entry
+        if user_id != user.pk or str(cached_problem_id) != str(problem_id):
+            return None
+        return solution
+
+    def memoized_verdict(self, solution, version):
+        """
+        memoized score of digest of solution, None if not memoized.
+        version : current answer version of problem, read from database.
+        memo of other version is never used, even if not expired.
+        """
+        if not solution.digest or solution.answer_version != version:
+            return None
+        key = VERDICT_KEY.format(
+            solution.submission.problem_id, solution.answer_version, solution.digest
+        )
+        return redis.get(key)
+
+    def grade(self, solutions) -> dict:
+        """
+        scores of solutions as {pk: score}, by digests of answers only.
+        verdicts are memoized per (problem, answer version, digest), so
+        duplicated answer costs single cache lookup.
+        solution is graded by current answer, memo of its answer version when
+        submitted is looked up only if that version is current one.
+        call with submission of solutions loaded.
+        """
+        # digests of current answers in single query, never texts nor snapshots
+        answers = Answer.objects.filter(
+            problem__in={s.submission.problem_id for s in solutions}
+        ).values_list("problem", "digest", "version", "normalization")
+        answers = {row[0]: row[1:] for row in answers}
+        current = {problem_id: row[1] for problem_id, row in answers.items()}
+
+        keys = {
+            s.pk: VERDICT_KEY.format(
+                s.submission.problem_id, s.answer_version, s.digest
+            )
+            for s in solutions
+            if s.digest and current.get(s.submission.problem_id) == s.answer_version
+        }
+        verdicts = redis.get_many(list(set(keys.values())))
+        scores = {pk: verdicts[key] for pk, key in keys.items() if key in verdicts}
+
+        missed = [s for s in solutions if s.pk not in scores]
+        if not missed:
+            return scores
+
+        memo = {}
+        for solution in missed:
+            problem_id = solution.submission.problem_id
+            if problem_id not in answers:  # deleted
+                scores[solution.pk] = 0
+                continue
+
+            digest, version, normalization = answers[problem_id]
+            if solution.answer_version != version or not solution.digest:
+                # answer changed after submitted
+                solution.digest = Answer.digest_of(solution.answer, normalization)
+                solution.answer_version = version
+            score = 100 if solution.digest == digest else 0
+            scores[solution.pk] = score
+            memo[VERDICT_KEY.format(problem_id, version, solution.digest)] = score
+
+        redis.set_many(memo, settings.VERDICT_TTL)
+        return scores
+
+    def with_cached_states(self, solutions):
+        """solutions still grading in database replaced with cached ones"""
+        keys = {
+            SOLUTION_KEY.format(s.pk): s
+            for s in solutions
+            if s.state != Solution.CHECK_DONE
+        }
+        cached = {
+            keys[key].pk: entry[2] for key, entry in redis.get_many(list(keys)).items()
+        }
+        return [cached.get(s.pk, s) for s in solutions]
+
 
 class Solution(
     AnswerModelBase,
@@ -284,6 +846,12 @@ class Solution(
         constraints = [
             ScoreModelBase.get_score_constraints("solution"),
         ]
+        indexes = [
+            # solution history of submission, latest first
+            models.Index(
+                fields=["submission", "-created_at"], name="solution_history_idx"
+            ),
+        ]
 
     submission = models.ForeignKey(
         "Submission",
@@ -296,6 +864,9 @@ class Solution(
         choices=CheckStateChoice.choices,
         default=CHECK_BEFORE,
     )
+    # digest by normalization of problem answer, which version was answer_version.
+    digest = models.CharField(max_length=64, blank=True)
+    answer_version = models.PositiveIntegerField(default=0)
 
     def __str__(self) -> str:
         return (
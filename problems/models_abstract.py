@@ -1,7 +1,8 @@
 from time import sleep
 
-from django.db import models
+from django.db import models, transaction
 from django.db.models import QuerySet
+from django.dispatch import Signal
 
 # from django.db.models.query import _BaseQuerySet
 from django.db.models.manager import BaseManager
@@ -29,7 +30,37 @@ class DelayQuerySet(QuerySet):
         return super().filter(*args, **kwargs)
 
 
-class DelayManager(models.Manager):
+# sent after QuerySet.update(), which does not send post_save.
+# kwargs : rows, values of 'pk' and model 'tracked_fields' before update.
+post_bulk_update = Signal()
+
+# sent after QuerySet.bulk_create(), which does not send post_save.
+# kwargs : objs, created instances with pk.
+post_bulk_create = Signal()
+
+
+class SignalingQuerySet(QuerySet):
+    """QuerySet sending post_bulk_update on update(), post_bulk_create on bulk_create"""
+
+    def update(self, **kwargs):
+        fields = ("pk", *getattr(self.model, "tracked_fields", ()))
+        with transaction.atomic(using=self.db):
+            rows = list(self.values(*fields))
+            updated = super().update(**kwargs)
+            post_bulk_update.send(sender=self.model, rows=rows)
+        return updated
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = super().bulk_create(objs, *args, **kwargs)
+        post_bulk_create.send(sender=self.model, objs=objs)
+        return objs
+
+
+class SignalingManager(models.Manager.from_queryset(SignalingQuerySet)):
+    """Manager of SignalingQuerySet"""
+
+
+class DelayManager(SignalingManager):
     def get(self, *args, **kwargs):
         """override method, to force time dealy"""
         # print("delay manager get called")
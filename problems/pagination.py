@@ -0,0 +1,99 @@
+"""
+Keyset(cursor) pagination of problem lists, ordered by (created_at, id).
+page is fetched by 'WHERE (created_at, id) > cursor', no OFFSET scan,
+and total count is read from cache, so deep pages cost same as first page.
+"""
+import base64
+from collections import OrderedDict
+
+from django.utils.dateparse import parse_datetime
+
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+from .models import Problem
+
+SEPARATOR = "|"
+
+
+def encode_cursor(created_at, id) -> str:
+    """opaque cursor of (created_at, id) of last row"""
+    raw = f"{created_at.isoformat()}{SEPARATOR}{id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """(created_at, id) of cursor, None for empty(first page)"""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        created_at, id = raw.split(SEPARATOR)
+        created_at, id = parse_datetime(created_at), int(id)
+    except ValueError:
+        created_at = None
+    if created_at is None:
+        raise ValidationError("invalid cursor.")
+    return created_at, id
+
+
+class KeysetPagination(BasePagination):
+    """
+    used when 'cursor' parameter is given, empty for first page.
+    'count=0' omits total count.
+    """
+
+    cursor_query_param = "cursor"
+    count_query_param = "count"
+    page_size = api_settings.PAGE_SIZE
+
+    @staticmethod
+    def is_requested(request):
+        return KeysetPagination.cursor_query_param in request.query_params
+
+    def paginate(self, request, levels, categories):
+        """ids of page, filtered by levels and categories"""
+        self.request = request
+        cursor = decode_cursor(request.query_params.get(self.cursor_query_param))
+
+        # one more row tells whether next page exists.
+        rows = Problem.objects.page_after(
+            levels, categories, cursor, self.page_size + 1
+        )
+        self.next_cursor = None
+        if len(rows) > self.page_size:
+            rows = rows[: self.page_size]
+            self.next_cursor = encode_cursor(rows[-1][1], rows[-1][0])
+
+        self.count = None
+        if request.query_params.get(self.count_query_param) != "0":
+            self.count = Problem.objects.get_cached_count(levels, categories)
+
+        return [id for id, _ in rows]
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        body = OrderedDict()
+        if self.count is not None:
+            body["count"] = self.count
+        body["next"] = self.get_next_link()
+        body["results"] = data
+        return Response(body)
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "properties": {
+                "count": {"type": "integer", "example": 123},
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
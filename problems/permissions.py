@@ -3,6 +3,13 @@ from rest_framework.permissions import (
     SAFE_METHODS,
 )
 
+from .models import Submission
+
+
+def _get(obj, name):
+    """attribute of model instance, or value of cached snapshot(dict)"""
+    return obj[name] if isinstance(obj, dict) else getattr(obj, name)
+
 
 class IsOwnerOrReadOnly(BasePermission):
     """Check permission of model which hold 'owner' field"""
@@ -12,10 +19,14 @@ class IsOwnerOrReadOnly(BasePermission):
         Check request auth with object owner attribute,
         when method is not UN_SAFE_METHOD(?)
         """
-        assert hasattr(obj, "owner"), "object does not have 'owner' attribute"
+        assert isinstance(obj, dict) or hasattr(
+            obj, "owner"
+        ), "object does not have 'owner' attribute"
 
         return bool(
-            request.method in SAFE_METHODS or request.user and request.user == obj.owner
+            request.method in SAFE_METHODS
+            or request.user
+            and request.user.pk == _get(obj, "owner_id")
         )
 
 
@@ -26,8 +37,8 @@ class IsOwnerOrSolvedUserReadOnly(BasePermission):
 
     def has_object_permission(self, request, view, obj):
 
-        if request.user == obj.owner:
+        if request.user.pk == _get(obj, "owner_id"):
             return True
 
-        submissions = request.user.submissions
-        return submissions and submissions.filter(problem=obj, score=100).exists()
+        solved = Submission.objects.solved_problem_ids(request.user)
+        return _get(obj, "id") in solved
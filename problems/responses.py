@@ -0,0 +1,98 @@
+"""
+Rendered response cache with conditional GET (ETag, Last-Modified).
+cached response is validated by version keys, which are bumped on change.
+Last-Modified is when rendered body last changed, not 'updated_at' of rows,
+body also depends on counts, names of relations and rows of page.
+"""
+
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from rest_framework.response import Response
+
+from config import redis
+from config.renderers import FastJSONRenderer
+
+# use .format()
+RESPONSE_KEY = "responses.{}"
+
+
+def _response_key(request, personal=False):
+    """
+    per url and auth class(anonymous or authenticated).
+    personal one is shared by every user too, user data merged after.
+    """
+    url = hashlib.md5(request.build_absolute_uri().encode()).hexdigest()
+    if personal:
+        return RESPONSE_KEY.format(f"personal.{url}")
+    auth = "auth" if request.user.is_authenticated else "anon"
+    return RESPONSE_KEY.format(f"{auth}.{url}")
+
+
+def cached_json_response(
+    request, version_keys, render, validator=None, timeout=None, personal=None
+):
+    """
+    response of cached json bytes, or 304 for conditional request.
+    render() -> data, called on miss only.
+    cached response is valid while versions of version_keys and validator
+    are same with when it was rendered.
+    timeout : seconds, rendered again after, for data which bumps no version.
+    kept longer to compare bodies, Last-Modified is not moved if same.
+    personal : (flags, merge) for response including user data. shared data
+    is cached once for all users, and merge(data) adds user data on request.
+    flags : hashable user data, in etag. no Last-Modified, which is not
+    moved by user data.
+    """
+    if request.accepted_renderer.format != "json":
+        data = render()
+        return Response(personal[1](data) if personal else data)
+
+    key = _response_key(request, personal is not None)
+    values = redis.get_many([key] + version_keys)
+    current = (validator, tuple(values.get(k, 0) for k in version_keys))
+
+    entry = values.get(key)
+    now = time.time()
+    if entry is None or entry[0] != current or entry[1] <= now:
+        body = FastJSONRenderer().render(render())
+        etag = '"{}"'.format(hashlib.md5(body).hexdigest())
+        modified = int(now)
+        if entry is not None:
+            _, _, _, previous_etag, previous = entry
+            # same body keeps its time, changed one is after previous always.
+            modified = (
+                previous if etag == previous_etag else max(modified, previous + 1)
+            )
+        fresh_until = now + timeout if timeout is not None else float("inf")
+        entry = (current, fresh_until, body, etag, modified)
+        redis.set(key, entry, settings.RESPONSE_CACHE_TTL)
+
+    _, _, body, etag, modified = entry
+
+    if personal is not None:
+        flags, merge = personal
+        etag = '"{}"'.format(hashlib.md5(f"{etag}{flags}".encode()).hexdigest())
+        modified = None
+
+    response = HttpResponse(content_type="application/json")
+    response.headers["ETag"] = etag
+    if modified is not None:
+        response.headers["Last-Modified"] = http_date(modified)
+
+    conditional = get_conditional_response(
+        request, etag=etag, last_modified=modified, response=response
+    )
+    if conditional is not response:
+        return conditional  # not modified, body is not needed
+
+    if personal is not None:
+        body = FastJSONRenderer().render(merge(json.loads(body)))
+    response.content = body
+    return response
@@ -1,10 +1,19 @@
 from django.contrib.auth.models import User
+from django.db import transaction
 
 from rest_framework.exceptions import ValidationError
 from rest_framework.serializers import ModelSerializer
 from rest_framework import serializers
 
-from .models import Problem, Category, Answer, Commentary, Submission, Solution
+from .models import (
+    Problem,
+    ProblemStats,
+    Category,
+    Answer,
+    Commentary,
+    Submission,
+    Solution,
+)
 
 
 class UserSerializer(ModelSerializer):
@@ -33,6 +42,7 @@ class AnswerSerializer(ModelSerializer):
     class Meta:
         model = Answer
         fields = "__all__"
+        read_only_fields = ("digest", "version")
 
 
 class CommentarySerializer(ModelSerializer):
@@ -44,22 +54,29 @@ class CommentarySerializer(ModelSerializer):
 
 
 class ProblemSerializerBase(ModelSerializer):
-    """Abstract serializer for problem read."""
+    """
+    Abstract serializer for problem read.
+    use with Problem.objects.with_counts() queryset, counts are annotated.
+    """
 
     owner = serializers.StringRelatedField(read_only=True)
     category = serializers.StringRelatedField(read_only=True)
 
     submitted_count = serializers.SerializerMethodField()
     solved_count = serializers.SerializerMethodField()
+    acceptance_rate = serializers.SerializerMethodField()
 
     class Meta:
         model = Problem
 
     def get_submitted_count(self, obj):
-        return obj.submitted_count()
+        return obj.num_submitted
 
     def get_solved_count(self, obj):
-        return obj.solved_count()
+        return obj.num_solved
+
+    def get_acceptance_rate(self, obj):
+        return obj.num_solved / obj.num_submitted if obj.num_submitted else 0.0
 
 
 class ProblemListSerializer(ProblemSerializerBase):
@@ -75,10 +92,92 @@ class ProblemListSerializer(ProblemSerializerBase):
             "owner",
             "submitted_count",
             "solved_count",
+            "acceptance_rate",
             # TODO : user solved
         )
         read_only_fields = ("name", "level")
 
+    @staticmethod
+    def from_values(row) -> dict:
+        """same representation from row of with_counts().list_values()"""
+        submitted, solved = row["num_submitted"], row["num_solved"]
+        return {
+            "id": row["id"],
+            "name": row["name"],
+            "level": row["level"],
+            "category": row["category__name"],
+            "owner": row["owner__username"],
+            "submitted_count": submitted,
+            "solved_count": solved,
+            "acceptance_rate": solved / submitted if submitted else 0.0,
+        }
+
+
+class ProblemSnapshotSerializer(ProblemSerializerBase):
+    """
+    Materialized problem with answer, commentary, names of relations and counts.
+    representation is cached as plain dict, and sliced for each response.
+    use with Problem.objects.aggregated() queryset.
+    """
+
+    owner_id = serializers.IntegerField(read_only=True)
+    category_id = serializers.IntegerField(read_only=True, allow_null=True)
+    commentary = CommentarySerializer(read_only=True)
+    answer = AnswerSerializer(read_only=True)
+
+    class Meta:
+        model = Problem
+        fields = (
+            "id",
+            "name",
+            "level",
+            "description",
+            "category",
+            "category_id",
+            "owner",
+            "owner_id",
+            "commentary",
+            "answer",
+            "submitted_count",
+            "solved_count",
+            "acceptance_rate",
+            "created_at",
+            "updated_at",
+        )
+
+    @classmethod
+    def to_snapshot(cls, problem) -> dict:
+        """plain dict of problem, nested dicts too"""
+        return {
+            key: dict(value) if isinstance(value, dict) else value
+            for key, value in cls(problem).data.items()
+        }
+
+    @staticmethod
+    def list_representation(snapshot, fields=None):
+        """same as ProblemListSerializer representation, or its fields only"""
+        fields = ProblemListSerializer.Meta.fields if fields is None else fields
+        return {field: snapshot[field] for field in fields}
+
+    @staticmethod
+    def detail_representation(snapshot):
+        """same as ProblemCreateUpdateSerializer representation"""
+        fields = (
+            "id",
+            "owner",
+            "category",
+            "commentary",
+            "answer",
+            "created_at",
+            "updated_at",
+            "name",
+            "level",
+            "description",
+        )
+        representation = {field: snapshot[field] for field in fields}
+        representation["category"] = snapshot["category_id"]
+        return representation
+
 
 class ProblemCreateUpdateSerializer(ModelSerializer):
     """
@@ -135,6 +234,19 @@ class ProblemCreateUpdateSerializer(ModelSerializer):
         return super().update(instance, validated_data)
 
 
+class ProblemImportSerializer(ProblemCreateUpdateSerializer):
+    """
+    Row of bulk import, validated without queries.
+    unique names and categories are checked for whole batch, see imports.
+    """
+
+    name = serializers.CharField(max_length=50)
+    category = serializers.IntegerField(allow_null=True, required=False)
+
+    class Meta(ProblemCreateUpdateSerializer.Meta):
+        fields = ("name", "level", "description", "category", "answer", "commentary")
+
+
 class SubmissionSerializer(serializers.ModelSerializer):
     class Meta:
         model = Submission
@@ -152,7 +264,7 @@ class SolutionSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Solution
-        fields = "__all__"
+        exclude = ("digest", "answer_version")
         read_only_fields = (
             "submission",
             "score",
@@ -174,7 +286,9 @@ class SolutionSerializer(serializers.ModelSerializer):
             serializer.is_valid(
                 raise_exception=True
             )  # raise 400 BAD_REQUEST, problem not exist
-            submission = serializer.save()
+            with transaction.atomic():
+                submission = serializer.save(user=user, problem_id=problem_id)
+                ProblemStats.objects.incr(problem_id, submitted=1)
 
         return submission
 
@@ -0,0 +1,229 @@
+"""
+Cache invalidation of problem related models.
+every invalidation runs on transaction commit, so uncommitted state is never cached.
+"""
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from config import redis  # custom redis interface
+
+from . import index
+
+from .models import (
+    Answer,
+    Category,
+    Commentary,
+    Problem,
+    ProblemStats,
+    CATEGORIES_VERSION_KEY,
+    GENERATION_KEY,
+    PROBLEM_KEY,
+    VERSION_KEY,
+    _generation_keys,
+)
+from .models_abstract import post_bulk_create, post_bulk_update
+
+
+def refresh_problems(ids):
+    """update cached snapshots if cached, otherwise evict local caches"""
+    index.invalidate(ids)
+    for id in ids:
+        key = PROBLEM_KEY.format(id)
+        redis.incr(VERSION_KEY.format(id))
+
+        if not redis.exists(key):
+            redis.invalidate_local(key)
+            continue
+
+        try:
+            snapshot = Problem.objects.get_snapshot(id)
+        except Problem.DoesNotExist:
+            redis.delete(key)
+        else:
+            redis.update(key, snapshot, settings.DEBUG_REDIS_PROBLEM_TTL)
+
+
+def evict_problems(ids):
+    """delete cached snapshots, for deleted or many changed problems"""
+    index.invalidate(ids)
+    redis.incr_many([VERSION_KEY.format(id) for id in ids])
+    redis.delete_many([PROBLEM_KEY.format(id) for id in ids])
+
+
+def bump_list_generations(*groups):
+    """
+    invalidate cached problem lists including problem of groups,
+    groups : (level, category_id) of changed problems, before and after.
+    """
+    keys = {GENERATION_KEY.format("all")}
+    for level, category_id in groups:
+        keys.update(_generation_keys([level], [category_id]))
+
+    for key in keys:
+        redis.incr(key)
+
+
+def _problems_of(**lookups):
+    return list(Problem._base_manager.filter(**lookups).values_list("pk", flat=True))
+
+
+@receiver(post_save, sender=Problem)
+def problem_saved(sender, instance, **kwargs):
+    pk = instance.pk
+    group = instance._list_group()
+    loaded = getattr(instance, "_loaded_group", group)
+    instance._loaded_group = group
+
+    def _invalidate():
+        refresh_problems([pk])
+        bump_list_generations(loaded, group)
+
+    transaction.on_commit(_invalidate)
+
+
+@receiver(post_delete, sender=Problem)
+def problem_deleted(sender, instance, **kwargs):
+    pk = instance.pk
+    group = instance._list_group()
+
+    def _invalidate():
+        evict_problems([pk])
+        bump_list_generations(group)
+
+    transaction.on_commit(_invalidate)
+
+
+@receiver(post_save, sender=Answer)
+@receiver(post_save, sender=Commentary)
+def answer_commentary_saved(sender, instance, **kwargs):
+    # not related yet when created before problem.
+    # deletion is protected while related, nothing to invalidate.
+    if not hasattr(instance, "problem"):
+        return
+
+    pk = instance.problem.pk
+    transaction.on_commit(lambda: refresh_problems([pk]))
+
+
+@receiver(post_save, sender=ProblemStats)
+def stats_saved(sender, instance, **kwargs):
+    # counts in snapshot
+    problem_id = instance.problem_id
+    transaction.on_commit(lambda: refresh_problems([problem_id]))
+
+
+@receiver(post_save, sender=Category)
+def category_saved(sender, instance, created, update_fields=None, **kwargs):
+    pk = instance.pk
+    renamed = not created and (update_fields is None or "name" in update_fields)
+
+    def _invalidate():
+        redis.incr(CATEGORIES_VERSION_KEY)
+        if renamed:  # category name in snapshots
+            evict_problems(_problems_of(category=pk))
+
+    transaction.on_commit(_invalidate)
+
+
+@receiver(pre_delete, sender=Category)
+def category_deleting(sender, instance, **kwargs):
+    # problems of category are SET_NULL without post_save signal.
+    problems = Problem._base_manager.filter(category=instance)
+    instance._problem_rows = list(problems.values_list("pk", "level"))
+
+
+@receiver(post_delete, sender=Category)
+def category_deleted(sender, instance, **kwargs):
+    pk = instance.pk
+    rows = getattr(instance, "_problem_rows", [])
+
+    def _invalidate():
+        redis.incr(CATEGORIES_VERSION_KEY)
+        evict_problems([id for id, _ in rows])
+        groups = {(level, category) for _, level in rows for category in (pk, None)}
+        bump_list_generations(*groups)
+
+    transaction.on_commit(_invalidate)
+
+
+@receiver(post_save, sender=User)
+def owner_saved(sender, instance, created, update_fields=None, **kwargs):
+    # username of owner in snapshots, skip login which updates last_login only.
+    if created or update_fields is not None and "username" not in update_fields:
+        return
+
+    pk = instance.pk
+    transaction.on_commit(lambda: evict_problems(_problems_of(owner=pk)))
+
+
+@receiver(post_bulk_update, sender=Problem)
+def problems_bulk_updated(sender, rows, **kwargs):
+    ids = [row["pk"] for row in rows]
+    loaded = {(row["level"], row["category_id"]) for row in rows}
+
+    def _invalidate():
+        problems = Problem._base_manager.filter(pk__in=ids)
+        groups = set(problems.values_list("level", "category_id").distinct())
+        evict_problems(ids)
+        bump_list_generations(*loaded, *groups)
+
+    transaction.on_commit(_invalidate)
+
+
+@receiver(post_bulk_create, sender=Problem)
+def problems_bulk_created(sender, objs, **kwargs):
+    # once for whole batch, tombstones of ids may be cached.
+    ids = [problem.pk for problem in objs]
+    groups = {problem._list_group() for problem in objs}
+
+    def _invalidate():
+        evict_problems(ids)
+        bump_list_generations(*groups)
+
+    transaction.on_commit(_invalidate)
+
+
+@receiver(post_bulk_update, sender=Answer)
+def answers_bulk_updated(sender, rows, **kwargs):
+    ids = [row["pk"] for row in rows]
+    # digests are data not cache, in transaction of update.
+    # written by plain queryset, not to send this again.
+    answers = list(QuerySet(Answer).filter(pk__in=ids))
+    changed = []
+    for answer in answers:
+        digest = answer.digest
+        answer.update_digest()
+        if answer.digest != digest:
+            changed.append(answer)
+    QuerySet(Answer).bulk_update(changed, ["digest", "version"])
+
+    transaction.on_commit(lambda: evict_problems(_problems_of(answer__in=ids)))
+
+
+@receiver(post_bulk_update, sender=Commentary)
+def commentaries_bulk_updated(sender, rows, **kwargs):
+    ids = [row["pk"] for row in rows]
+    transaction.on_commit(lambda: evict_problems(_problems_of(commentary__in=ids)))
+
+
+@receiver(post_bulk_update, sender=Category)
+def categories_bulk_updated(sender, rows, **kwargs):
+    ids = [row["pk"] for row in rows]
+
+    def _invalidate():
+        redis.incr(CATEGORIES_VERSION_KEY)
+        evict_problems(_problems_of(category__in=ids))
+
+    transaction.on_commit(_invalidate)
+
+
+@receiver(post_bulk_update, sender=ProblemStats)
+def stats_bulk_updated(sender, rows, **kwargs):
+    # counters are incremented, refresh counts in snapshot
+    ids = [row["pk"] for row in rows]
+    transaction.on_commit(lambda: refresh_problems(ids))
@@ -1,39 +1,165 @@
+import threading
+from collections import Counter
 from time import sleep
 
 from django.conf import settings
+from django.db import OperationalError, transaction
+from django.utils import timezone
 
 from celery import shared_task
 
-from .models import Problem, Solution
+from .models import ProblemStats, Solution, Submission
 
+# inline gradings at once in process, queued when all taken.
+_inline_slots = threading.BoundedSemaphore(settings.INLINE_GRADING_CONCURRENCY)
 
-@shared_task
-def check_answer_and_update_score(problem_id, solution_id):
-    """call after solution model saved"""
-    # TODO : atomic?
 
-    # TODO : how to notify to client when this task finished
-    # web-socket, receive callback url from client,
+def record_score(solution, score):
+    """
+    save graded solution and its state, unless done by other grading.
+    submission is updated, counted as solved on first 100 only.
+    call with submission of solution loaded.
+    """
+    solution.score = score
+    # done with submission together, or not at all for retry.
+    with transaction.atomic():
+        if not Solution.objects.finish(solution):
+            return
 
-    # update state
-    solution = Solution.objects.get(pk=solution_id)
-    solution.state = Solution.CHEKING
-    solution.save()
+        if score == 100:
+            problem_id = solution.submission.problem_id
+            solved = Submission.objects.filter(
+                pk=solution.submission_id, score__lt=score
+            ).update(score=score)
+            if solved:
+                ProblemStats.objects.incr(problem_id, solved=1)
+                user_id = solution.submission.user_id
+                transaction.on_commit(
+                    lambda: Submission.objects.add_solved(user_id, problem_id)
+                )
 
-    sleep(settings.DEBUG_PROBLEM_CHECK_DELAY)  # condition.
+        transaction.on_commit(lambda: Solution.objects.cache_state(solution))
 
-    problem = Problem.objects.get_cached_problem(problem_id)
 
-    # compare answer with given answer
-    score = 100 if solution.answer == problem.answer.answer else 0
-    solution.score = score
-    solution.state = Solution.CHECK_DONE
-    solution.save()
+def grade_inline(solution, answer):
+    """
+    grade solution in request without queue, when verdict of its digest is
+    memoized and answers of solution and problem are short.
+    answer : 'version' and 'length' of answer of problem, read from database.
+    returns score, or None to be queued, also when inline gradings are busy.
+    """
+    limit = settings.INLINE_GRADING_MAX_LENGTH
+    if not settings.INLINE_GRADING_ENABLED or len(solution.answer) > limit:
+        return None
+    if answer["length"] > limit:
+        return None  # expensive problem
 
-    # update submission
-    if score == 100:
-        submission = solution.submission
-        submission.score = max(submission.score, score)
-        submission.save()
+    if not _inline_slots.acquire(blocking=False):
+        return None  # under load
+    try:
+        score = Solution.objects.memoized_verdict(solution, answer["version"])
+        if score is not None:
+            record_score(solution, score)
+        return score
+    finally:
+        _inline_slots.release()
+
+
+@shared_task(
+    acks_late=True,
+    reject_on_worker_lost=True,
+    autoretry_for=(OperationalError,),
+    retry_backoff=True,
+    max_retries=settings.GRADING_MAX_RETRIES,
+)
+def check_answer_and_update_score(problem_id, solution_id):
+    """
+    call after solution model saved.
+    idempotent, solution is claimed by conditional update and graded once
+    by concurrent or redelivered tasks. others return score if done, or None.
+    """
+    if not Solution.objects.claim(solution_id):
+        done = Solution.objects.filter(pk=solution_id, state=Solution.CHECK_DONE)
+        return done.values_list("score", flat=True).first()
+
+    try:
+        # grading state lives in redis until done, polled without database,
+        # and pushed to clients waiting on events. see events.
+        solution = Solution.objects.select_related("submission").get(pk=solution_id)
+        Solution.objects.cache_state(solution)
+
+        sleep(settings.DEBUG_PROBLEM_CHECK_DELAY)  # condition.
+
+        # compare digests, memoized for duplicated answers
+        score = Solution.objects.grade([solution])[solution.pk]
+        record_score(solution, score)
+    except OperationalError:
+        Solution.objects.release(solution_id)  # claimed again by retry
+        raise
 
     return score
+
+
+@shared_task(
+    acks_late=True,
+    reject_on_worker_lost=True,
+    autoretry_for=(OperationalError,),
+    retry_backoff=True,
+    max_retries=settings.GRADING_MAX_RETRIES,
+)
+def grade_pending_solutions(limit=None, solution_ids=None):
+    """
+    grade up to limit pending solutions at once, for bursts of submissions.
+    solution_ids : grade among these only, None for any pending.
+    verdicts are memoized by answer digests(misses in single query),
+    and results are written with bulk_update and single submission update.
+    solutions are claimed and finished by conditional updates as
+    check_answer_and_update_score, graded outside of transaction.
+    returns number of graded solutions.
+    """
+    limit = limit if limit else settings.GRADING_BATCH_SIZE
+
+    solutions = Solution.objects.claim_pending(limit, solution_ids)
+    if not solutions:
+        return 0
+
+    # claimed, committed states only are cached and published.
+    Solution.objects.cache_states(solutions)
+
+    try:
+        sleep(settings.DEBUG_PROBLEM_CHECK_DELAY)  # condition, once for batch.
+
+        scores = Solution.objects.grade(solutions)
+        for solution in solutions:
+            solution.score = scores[solution.pk]
+
+        with transaction.atomic():
+            finished = Solution.objects.finish_many(solutions)
+
+            # submissions counted as solved on first 100 only.
+            solved = {s.submission_id for s in finished if s.score == 100}
+            flipped = list(
+                Submission.objects.select_for_update()
+                .filter(pk__in=solved, score__lt=100)
+                .values_list("pk", "user_id", "problem_id")
+            )
+            if flipped:
+                Submission.objects.filter(
+                    pk__in=[pk for pk, _, _ in flipped], score__lt=100
+                ).update(score=100, updated_at=timezone.now())
+                counts = Counter(problem_id for _, _, problem_id in flipped)
+                for problem_id, count in counts.items():
+                    ProblemStats.objects.incr(problem_id, solved=count)
+
+                def _add_solved():
+                    for _, user_id, problem_id in flipped:
+                        Submission.objects.add_solved(user_id, problem_id)
+
+                transaction.on_commit(_add_solved)
+
+            transaction.on_commit(lambda: Solution.objects.cache_states(finished))
+    except OperationalError:
+        Solution.objects.release(*[s.pk for s in solutions])  # for retry
+        raise
+
+    return len(finished)
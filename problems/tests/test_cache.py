@@ -0,0 +1,728 @@
+import threading
+import time
+from io import StringIO
+from unittest import mock
+
+from django.apps import apps
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from redis.client import PubSub
+from redis.exceptions import ConnectionError
+from rest_framework.test import APIRequestFactory
+
+from config import metrics, redis, pubsub
+from config.local_cache import LocalCache
+
+from .. import responses, warmup
+from ..index import ProblemIndex
+from ..models import (
+    Category,
+    Problem,
+    ProblemStats,
+    Submission,
+    PROBLEM_KEY,
+    SOLVED_KEY,
+    VERSION_KEY,
+    parse_values,
+)
+
+from . import test_models
+
+
+class GetOrComputeTestCase(TestCase):
+    key = "test.get_or_compute"
+
+    def setUp(self) -> None:
+        cache.delete(self.key)
+        cache.delete(redis.LOCK_KEY.format(self.key))
+        redis.local_cache.clear()
+
+    def test_compute_once(self):
+
+        loader = mock.Mock(return_value="value")
+
+        self.assertEqual(redis.get_or_compute(self.key, loader), "value")
+        self.assertEqual(redis.get_or_compute(self.key, loader), "value")
+        self.assertEqual(loader.call_count, 1)
+
+    def test_loader_error_not_cached(self):
+
+        loader = mock.Mock(side_effect=Problem.DoesNotExist)
+
+        with self.assertRaises(Problem.DoesNotExist):
+            redis.get_or_compute(self.key, loader)
+
+        self.assertFalse(redis.exists(self.key))
+
+    def test_early_recompute(self):
+
+        redis.get_or_compute(self.key, lambda: "old")
+
+        # huge beta, always recompute before expiry
+        value = redis.get_or_compute(self.key, lambda: "new", beta=10**12)
+        self.assertEqual(value, "new")
+
+    def test_serve_stale_while_locked(self):
+
+        redis.get_or_compute(self.key, lambda: "old")
+
+        lock = cache.lock(redis.LOCK_KEY.format(self.key), timeout=10)
+        self.assertTrue(lock.acquire(blocking=False))
+        try:
+            loader = mock.Mock(return_value="new")
+            value = redis.get_or_compute(self.key, loader, beta=10**12)
+        finally:
+            lock.release()
+
+        self.assertEqual(value, "old")
+        loader.assert_not_called()
+
+    def test_lock_expired_while_computing(self):
+
+        def loader():
+            # expired, and taken by other process meanwhile
+            cache.set(redis.LOCK_KEY.format(self.key), "other", 10)
+            return "value"
+
+        self.assertEqual(redis.get_or_compute(self.key, loader), "value")
+        self.assertEqual(cache.get(redis.LOCK_KEY.format(self.key)), "other")
+
+    def test_many_serve_stale_while_locked(self):
+
+        loader = mock.Mock(side_effect=lambda keys: dict.fromkeys(keys, "old"))
+        redis.get_or_compute_many_local([self.key], loader)
+        redis.local_cache.clear()
+
+        lock = cache.lock(redis.LOCK_KEY.format(self.key), timeout=10)
+        self.assertTrue(lock.acquire(blocking=False))
+        loader = mock.Mock(side_effect=lambda keys: dict.fromkeys(keys, "new"))
+        try:
+            with mock.patch.object(redis, "XFETCH_BETA", 10**12):
+                values = redis.get_or_compute_many_local([self.key], loader)
+        finally:
+            lock.release()
+        self.assertEqual(values, {self.key: "old"})
+        loader.assert_not_called()
+
+        # early recompute by holder of lock
+        redis.local_cache.clear()
+        with mock.patch.object(redis, "XFETCH_BETA", 10**12):
+            values = redis.get_or_compute_many_local([self.key], loader)
+        self.assertEqual(values, {self.key: "new"})
+        self.assertIsNone(cache.get(redis.LOCK_KEY.format(self.key)))  # released
+
+    def test_many_wait_other_computing(self):
+
+        lock = cache.lock(redis.LOCK_KEY.format(self.key), timeout=10)
+        self.assertTrue(lock.acquire(blocking=False))
+        # other process caches value while holding lock
+        other = threading.Timer(0.2, lambda: redis.preload({self.key: "other"}))
+        other.start()
+        loader = mock.Mock(side_effect=lambda keys: dict.fromkeys(keys, "value"))
+        try:
+            values = redis.get_or_compute_many_local([self.key], loader)
+        finally:
+            other.join()
+            lock.release()
+        self.assertEqual(values, {self.key: "other"})
+        loader.assert_not_called()
+
+        # waited too long, loaded without lock
+        redis.local_cache.clear()
+        cache.delete(self.key)
+        self.assertTrue(lock.acquire(blocking=False))
+        try:
+            with mock.patch.object(redis, "LOCK_WAIT_TIMEOUT", 0.2):
+                values = redis.get_or_compute_many_local([self.key], loader)
+        finally:
+            lock.release()
+        self.assertEqual(values, {self.key: "value"})
+
+
+class LocalCacheTestCase(TestCase):
+    def test_lru_eviction(self):
+
+        local = LocalCache(max_size=2, ttl=10)
+        local.set("a", 1)
+        local.set("b", 2)
+        local.get("a")  # b is least recently used
+        local.set("c", 3)
+
+        self.assertEqual(len(local), 2)
+        self.assertIsNone(local.get("b"))
+        self.assertEqual(local.get("a"), 1)
+        self.assertEqual(local.get("c"), 3)
+
+    def test_ttl(self):
+
+        local = LocalCache(max_size=2, ttl=10)
+        with mock.patch("config.local_cache.time.monotonic", return_value=0):
+            local.set("a", 1)
+        with mock.patch("config.local_cache.time.monotonic", return_value=10):
+            self.assertIsNone(local.get("a"))
+
+
+@override_settings(PUBSUB_BACKEND="local")
+class PubSubTestCase(TestCase):
+    def test_local_publish(self):
+
+        received = []
+        pubsub.subscribe("test.channel", received.append)
+        pubsub.publish("test.channel", "message")
+        pubsub.unsubscribe("test.channel", received.append)
+        pubsub.publish("test.channel", "not received")
+
+        self.assertEqual(received, ["message"])
+
+    def _receive(self, channel):
+        """(messages received, event set on each) of subscribed channel"""
+        messages, received = [], threading.Event()
+
+        def callback(message):
+            messages.append(message)
+            received.set()
+
+        pubsub.subscribe(channel, callback)
+        self.addCleanup(pubsub.unsubscribe, channel, callback)
+        return messages, received
+
+    @override_settings(PUBSUB_BACKEND="redis")
+    def test_redis_publish(self):
+
+        messages, received = self._receive("test.redis")  # subscribed on return
+        pubsub.publish("test.redis", "message")
+
+        self.assertTrue(received.wait(5))
+        self.assertEqual(messages, ["message"])
+
+    @override_settings(PUBSUB_BACKEND="redis")
+    def test_listener_reconnects(self):
+
+        messages, received = self._receive("test.reconnect")
+        get_message = PubSub.get_message
+        failed = []
+
+        def flaky(self, *args, **kwargs):
+            if not failed:
+                failed.append(True)
+                raise ConnectionError("lost")
+            return get_message(self, *args, **kwargs)
+
+        with mock.patch.object(PubSub, "get_message", flaky), mock.patch.object(
+            pubsub, "RECONNECT_DELAY", 0
+        ), self.assertLogs("config.pubsub", "ERROR"):
+            while not failed:
+                time.sleep(0.01)
+            # subscribed again after reconnected
+            for _ in range(50):
+                pubsub.publish("test.reconnect", "message")
+                if received.wait(0.1):
+                    break
+
+        self.assertTrue(failed)
+        self.assertIn("message", messages)
+
+
+class ProblemCacheTestCase(TestCase):
+    def setUp(self) -> None:
+        cache.delete_pattern("*")
+        redis.local_cache.clear()
+        test_models.create_n_users(1)
+        test_models.create_n_categories(1)
+        test_models.create_n_problem(1, User.objects.all(), Category.objects.all())
+
+    def test_get_cached_snapshot(self):
+
+        snapshot = Problem.objects.get_cached_snapshot(1)
+
+        self.assertTrue(redis.exists(PROBLEM_KEY.format(1)))
+        redis.local_cache.clear()  # redis hit
+        with self.assertNumQueries(0):
+            self.assertEqual(Problem.objects.get_cached_snapshot(1), snapshot)
+
+    def test_snapshot(self):
+
+        problem = Problem.objects.get(pk=1)
+        with self.assertNumQueries(1):
+            snapshot = Problem.objects.get_snapshot(1)
+
+        self.assertIs(type(snapshot), dict)
+        self.assertIs(type(snapshot["answer"]), dict)
+        self.assertEqual(snapshot["answer"]["answer"], problem.answer.answer)
+        self.assertEqual(snapshot["commentary"]["comment"], problem.commentary.comment)
+        self.assertEqual(snapshot["owner"], problem.owner.username)
+        self.assertEqual(snapshot["category"], problem.category.name)
+        self.assertEqual(snapshot["submitted_count"], 0)
+        self.assertEqual(snapshot["solved_count"], 0)
+
+    def test_cache_updated_after_save(self):
+
+        Problem.objects.get_cached_snapshot(1)
+        problem = Problem.objects.get(pk=1)
+        problem.name = "updated"
+        with self.captureOnCommitCallbacks(execute=True):
+            problem.save()
+
+        self.assertEqual(Problem.objects.get_cached_snapshot(1)["name"], "updated")
+
+    def test_cache_updated_after_submission(self):
+
+        Problem.objects.get_cached_snapshot(1)
+        version = redis.get(VERSION_KEY.format(1))
+        with mock.patch("config.pubsub.publish") as publish:
+            with self.captureOnCommitCallbacks(execute=True):
+                ProblemStats.objects.incr(1, submitted=2, solved=1)
+
+        # counts patched only, not refetched nor re-versioned.
+        publish.assert_not_called()
+        self.assertEqual(redis.get(VERSION_KEY.format(1)), version)
+
+        snapshot = Problem.objects.get_cached_snapshot(1)
+        self.assertEqual(snapshot["submitted_count"], 2)
+        self.assertEqual(snapshot["solved_count"], 1)
+        self.assertEqual(snapshot["acceptance_rate"], 0.5)
+
+    def test_local_cache_hit(self):
+
+        Problem.objects.get_cached_snapshot(1)
+        cache.delete_pattern("*")  # no redis round trip on local hit
+
+        with self.assertNumQueries(0):
+            Problem.objects.get_cached_snapshot(1)
+
+    def test_local_cache_evicted_after_answer_save(self):
+
+        Problem.objects.get_cached_snapshot(1)
+        answer = Problem.objects.get(pk=1).answer
+        answer.answer = "updated"
+        with self.captureOnCommitCallbacks(execute=True):
+            answer.save()
+
+        self.assertIsNone(redis.local_cache.get(PROBLEM_KEY.format(1)))
+        snapshot = Problem.objects.get_cached_snapshot(1)
+        self.assertEqual(snapshot["answer"]["answer"], "updated")
+
+    def test_tombstone(self):
+
+        with self.assertRaises(Problem.DoesNotExist):
+            Problem.objects.get_cached_snapshot(0)
+
+        redis.local_cache.clear()  # single redis read
+        with self.assertNumQueries(0), self.assertRaises(Problem.DoesNotExist):
+            Problem.objects.get_cached_snapshot(0)
+        self.assertEqual(redis.get(PROBLEM_KEY.format(0))[0], redis.TOMBSTONE)
+
+    def test_tombstone_cleared_after_create(self):
+
+        id = Problem.objects.order_by("-id").first().pk + 1
+        with self.assertRaises(Problem.DoesNotExist):
+            Problem.objects.get_cached_snapshot(id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            problem = test_models.create_problem(
+                name="tombstone",
+                answer="answer",
+                commentary="comment",
+                description="description",
+                level=1,
+                owner=User.objects.first(),
+                category=Category.objects.first(),
+            )
+
+        self.assertEqual(problem.pk, id)
+        self.assertEqual(Problem.objects.get_cached_snapshot(id)["name"], "tombstone")
+
+    def test_not_invalidated_before_commit(self):
+
+        Problem.objects.get_cached_snapshot(1)
+        problem = Problem.objects.get(pk=1)
+        problem.name = "uncommitted"
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            problem.save()
+            self.assertNotEqual(
+                Problem.objects.get_cached_snapshot(1)["name"], "uncommitted"
+            )
+
+        for callback in callbacks:
+            callback()
+        self.assertEqual(Problem.objects.get_cached_snapshot(1)["name"], "uncommitted")
+
+    def test_cache_evicted_after_delete(self):
+
+        Problem.objects.get_cached_snapshot(1)
+        with self.captureOnCommitCallbacks(execute=True):
+            Problem.objects.get(pk=1).delete()
+
+        self.assertFalse(redis.exists(PROBLEM_KEY.format(1)))
+        with self.assertRaises(Problem.DoesNotExist):
+            Problem.objects.get_cached_snapshot(1)
+
+    def test_cache_evicted_after_bulk_update(self):
+
+        Problem.objects.get_cached_snapshot(1)
+        with self.captureOnCommitCallbacks(execute=True):
+            Problem.objects.filter(pk=1).update(name="bulk")
+
+        self.assertEqual(Problem.objects.get_cached_snapshot(1)["name"], "bulk")
+
+    def test_cache_evicted_after_category_rename(self):
+
+        Problem.objects.get_cached_snapshot(1)
+        category = Category.objects.get(pk=1)
+        category.name = "renamed"
+        with self.captureOnCommitCallbacks(execute=True):
+            category.save()
+
+        self.assertEqual(Problem.objects.get_cached_snapshot(1)["category"], "renamed")
+
+
+class ProblemListCacheTestCase(TestCase):
+    def setUp(self) -> None:
+        cache.delete_pattern("*")
+        redis.local_cache.clear()
+        test_models.create_n_users(1)
+        test_models.create_n_categories(2)
+        test_models.create_n_problem(2, User.objects.all(), Category.objects.all())
+
+    def _create(self, name, level, category_id):
+        with self.captureOnCommitCallbacks(execute=True):
+            return test_models.create_problem(
+                name=name,
+                answer=name,
+                commentary=name,
+                description=name,
+                level=level,
+                owner=User.objects.first(),
+                category=Category.objects.get(pk=category_id),
+            )
+
+    def test_list_invalidated_after_create(self):
+
+        prev_n = len(Problem.objects.get_cached_ids([], []))
+        level_n = len(Problem.objects.get_cached_ids([5], []))
+
+        self._create("created", 5, 1)
+
+        self.assertEqual(len(Problem.objects.get_cached_ids([], [])), prev_n + 1)
+        self.assertEqual(len(Problem.objects.get_cached_ids([5], [])), level_n + 1)
+
+    def test_list_invalidated_after_level_change(self):
+
+        problem = self._create("moved", 5, 1)
+        self.assertIn(problem.pk, Problem.objects.get_cached_ids([5], []))
+
+        problem = Problem.objects.get(pk=problem.pk)
+        problem.level = 4
+        with self.captureOnCommitCallbacks(execute=True):
+            problem.save()
+
+        self.assertNotIn(problem.pk, Problem.objects.get_cached_ids([5], []))
+        self.assertIn(problem.pk, Problem.objects.get_cached_ids([4], []))
+
+    def test_list_invalidated_after_delete(self):
+
+        problem = self._create("deleted", 5, 2)
+        self.assertIn(problem.pk, Problem.objects.get_cached_ids([], [2]))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            problem.delete()
+
+        self.assertEqual(
+            list(Problem.objects.get_cached_ids([], [2])),
+            list(Problem.objects.filter(category=2).values_list("id", flat=True)),
+        )
+
+    def test_list_invalidated_after_bulk_update(self):
+
+        problem = self._create("bulk_moved", 5, 1)
+        self.assertIn(problem.pk, Problem.objects.get_cached_ids([5], []))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Problem.objects.filter(pk=problem.pk).update(level=4)
+
+        self.assertNotIn(problem.pk, Problem.objects.get_cached_ids([5], []))
+        self.assertIn(problem.pk, Problem.objects.get_cached_ids([4], []))
+
+    def test_list_invalidated_after_category_delete(self):
+
+        problem = self._create("orphan", 5, 2)
+        self.assertIn(problem.pk, Problem.objects.get_cached_ids([], [2]))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Category.objects.get(pk=2).delete()
+
+        self.assertNotIn(problem.pk, Problem.objects.get_cached_ids([], [2]))
+
+    def test_empty_list_cached(self):
+
+        self.assertEqual(len(Problem.objects.get_cached_ids([99], [])), 0)
+        with self.assertNumQueries(0):
+            self.assertEqual(len(Problem.objects.get_cached_ids([99], [])), 0)
+
+    def test_other_list_not_invalidated(self):
+
+        Problem.objects.get_cached_ids([1], [])
+        generation_key = "problems.generation.level.1"
+        generation = redis.get(generation_key)
+
+        self._create("other_level", 5, 1)
+
+        self.assertEqual(redis.get(generation_key), generation)
+
+    def test_parse_values(self):
+
+        self.assertEqual(parse_values("2, 1,2"), [1, 2])
+        self.assertEqual(parse_values(""), [])
+        with self.assertRaises(ValueError):
+            parse_values("1,a")
+
+    def test_canonical_key(self):
+
+        ids = Problem.objects.get_cached_ids(parse_values("1,2"), [])
+
+        with mock.patch.object(Problem.objects, "filter") as filter:
+            for levels in ["2,1", "1, 2", "2,1,2"]:
+                self.assertEqual(
+                    Problem.objects.get_cached_ids(parse_values(levels), []), ids
+                )
+        filter.assert_not_called()
+
+    def test_get_cached_snapshots(self):
+
+        ids = list(Problem.objects.get_cached_ids([], []))
+        Problem.objects.get_cached_snapshots(ids[:1])  # cache first only
+        cache.delete(PROBLEM_KEY.format(ids[0]))  # still local cache
+
+        with self.assertNumQueries(1):
+            snapshots = Problem.objects.get_cached_snapshots(list(reversed(ids)) + [0])
+
+        self.assertEqual([s["id"] for s in snapshots], list(reversed(ids)))
+        self.assertTrue(redis.exists(PROBLEM_KEY.format(ids[-1])))
+
+
+class WarmUpTestCase(TestCase):
+    def setUp(self) -> None:
+        cache.delete_pattern("*")
+        redis.local_cache.clear()
+        test_models.create_n_users(1)
+        test_models.create_n_categories(2)
+        test_models.create_n_problem(3, User.objects.all(), Category.objects.all())
+
+    @override_settings(CACHE_WARMUP_ON_STARTUP=True)
+    def test_warm_on_startup(self):
+
+        with mock.patch.object(warmup, "warm_in_background") as warm:
+            apps.get_app_config("problems").ready()  # every command, not warmed
+            warm.assert_not_called()
+
+            warmup.warm_on_startup()  # server entry points
+            warm.assert_called_once()
+
+    def test_warm(self):
+
+        report = warmup.warm(chunk_size=2, concurrency=1)
+
+        self.assertEqual(report["problems"], 3)
+        for id in Problem.objects.values_list("id", flat=True):
+            self.assertTrue(redis.exists(PROBLEM_KEY.format(id)))
+        problem = Problem.objects.first()
+        with self.assertNumQueries(0):
+            Problem.objects.get_cached_ids([], [])
+            Problem.objects.get_cached_ids([problem.level], [])
+            Problem.objects.get_cached_ids([], [problem.category_id])
+
+    def test_dry_run_writes_nothing(self):
+
+        out = StringIO()
+        call_command("warm_cache", "--dry-run", stdout=out)
+
+        self.assertIn("problems 3", out.getvalue())
+        self.assertFalse(redis.exists(PROBLEM_KEY.format(1)))
+
+    def test_estimate(self):
+
+        report = warmup.estimate(chunk_size=1)
+
+        self.assertEqual(report["problems"], 3)
+        self.assertGreater(report["problem_bytes"], 0)
+        self.assertEqual(
+            report["total_bytes"], report["problems_bytes"] + report["lists_bytes"]
+        )
+
+
+class ProblemIndexTestCase(TestCase):
+    def setUp(self) -> None:
+        test_models.create_n_users(1)
+        test_models.create_n_categories(2)
+        test_models.create_n_problem(5, User.objects.all(), Category.objects.all())
+        self.index = ProblemIndex(ttl=60)
+
+    def _ids(self, queryset):
+        return list(queryset.order_by("created_at", "id").values_list("id", flat=True))
+
+    def test_filter(self):
+
+        self.assertEqual(list(self.index.filter([], [])), self._ids(Problem.objects))
+        self.assertEqual(
+            list(self.index.filter([1, 2], [1])),
+            self._ids(Problem.objects.filter(level__in=[1, 2], category=1)),
+        )
+
+    def test_recommend(self):
+
+        ProblemStats.objects.incr(Problem.objects.first().pk, submitted=1)
+        expected = Problem.objects.recommend(5)
+
+        self.assertEqual(self.index.recommend(5), [p.pk for p in expected])
+        self.assertEqual(
+            self.index.recommend(5, exclude={expected[0].pk}),
+            [p.pk for p in expected[1:]],
+        )
+
+    def test_invalidate(self):
+
+        self.index.filter([], [])
+        updated = Problem.objects.first()
+        Problem.objects.filter(pk=updated.pk).update(level=5, category=2)
+        deleted = Problem.objects.last().pk
+        Problem.objects.get(pk=deleted).delete()
+        created = test_models.create_problem(
+            name="indexed",
+            answer="answer",
+            commentary="comment",
+            description="description",
+            level=1,
+            owner=User.objects.first(),
+            category=Category.objects.first(),
+        )
+
+        with self.assertNumQueries(0):  # not invalidated yet
+            self.assertIn(deleted, self.index.filter([], []))
+
+        self.index.invalidate([updated.pk, deleted, created.pk])
+        with self.assertNumQueries(1):
+            ids = list(self.index.filter([], []))
+        self.assertEqual(ids, self._ids(Problem.objects))
+        self.assertIn(updated.pk, self.index.filter([5], [2]))
+
+
+class SolvedSetTestCase(TestCase):
+    def setUp(self) -> None:
+        test_models.create_n_users(1)
+        test_models.create_n_categories(1)
+        test_models.create_n_problem(3, User.objects.all(), Category.objects.all())
+        self.user = User.objects.first()
+        cache.delete(SOLVED_KEY.format(self.user.pk))
+
+    def test_cached(self):
+
+        problem = Problem.objects.first()
+        test_models.create_submission(self.user, problem, score=100)
+
+        self.assertEqual(Submission.objects.solved_problem_ids(self.user), {problem.pk})
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                Submission.objects.solved_problem_ids(self.user), {problem.pk}
+            )
+
+    def test_empty_cached(self):
+
+        self.assertEqual(Submission.objects.solved_problem_ids(self.user), set())
+        with self.assertNumQueries(0):
+            self.assertEqual(Submission.objects.solved_problem_ids(self.user), set())
+
+    def test_add_solved(self):
+
+        # not cached, not created partially
+        Submission.objects.add_solved(self.user.pk, 1)
+        self.assertIsNone(redis.get_set(SOLVED_KEY.format(self.user.pk)))
+
+        Submission.objects.solved_problem_ids(self.user)
+        Submission.objects.add_solved(self.user.pk, 1)
+        self.assertEqual(Submission.objects.solved_problem_ids(self.user), {1})
+
+    def test_solved_while_loading(self):
+
+        # solve committed after rows were read, before set is cached
+        problem = Problem.objects.first()
+        values_list = Submission.objects.filter(user=self.user).values_list
+
+        def _read_then_solve(*args, **kwargs):
+            rows = list(values_list(*args, **kwargs))
+            test_models.create_submission(self.user, problem, score=100)
+            Submission.objects.add_solved(self.user.pk, problem.pk)
+            return rows
+
+        with mock.patch.object(
+            Submission.objects,
+            "filter",
+            return_value=mock.Mock(values_list=_read_then_solve),
+        ):
+            self.assertEqual(Submission.objects.solved_problem_ids(self.user), set())
+
+        # stale rows not cached, loaded again
+        self.assertIsNone(redis.get_set(SOLVED_KEY.format(self.user.pk)))
+        self.assertEqual(Submission.objects.solved_problem_ids(self.user), {problem.pk})
+
+
+class CacheMetricsTestCase(TestCase):
+    key = "test.metrics"
+
+    def setUp(self) -> None:
+        cache.delete(self.key)
+
+    def _count(self, name):
+        return metrics._counters[(metrics.family(self.key), name)]
+
+    def test_family(self):
+
+        self.assertEqual(metrics.family("problems.1"), "problems.<id>")
+        self.assertEqual(
+            metrics.family("problems.levels=1.categories=.generation=0"),
+            "problems.levels=...",
+        )
+        self.assertEqual(
+            metrics.family("problems.generation.level.1"), "problems.generation"
+        )
+
+        # responses with user data, one key for every user
+        request = APIRequestFactory().get("/problems/")
+        keys = set()
+        for pk in [1, 2]:
+            request.user = mock.Mock(pk=pk, is_authenticated=True)
+            keys.add(responses._response_key(request, personal=True))
+        self.assertEqual(len(keys), 1)
+        self.assertEqual(metrics.family(keys.pop()), "responses.personal")
+
+    def test_hits_misses_bytes(self):
+
+        misses, hits = self._count("misses"), self._count("hits")
+        written, read = self._count("bytes_written"), self._count("bytes_read")
+
+        redis.get_or_compute(self.key, lambda: "value")
+        redis.get_or_compute(self.key, lambda: "value")
+
+        # miss, miss after lock and hit
+        self.assertEqual(self._count("misses"), misses + 2)
+        self.assertEqual(self._count("hits"), hits + 1)
+        self.assertGreater(self._count("bytes_written"), written)
+        self.assertGreater(self._count("bytes_read"), read)
+
+    def test_flush(self):
+
+        redis.get(self.key)
+        metrics.flush()
+
+        fields = metrics.aggregated()
+        self.assertGreater(fields[f"{metrics.family(self.key)}|misses"], 0)
+
+    def test_metrics_view(self):
+
+        redis.get(self.key)
+        response = self.client.get("/metrics/cache")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('family="test.metrics"', response.content.decode())
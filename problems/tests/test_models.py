@@ -1,16 +1,21 @@
+import re
+from importlib import import_module
 from random import randint
 from unittest import mock
 from datetime import datetime
 
 from django.contrib.auth.models import User
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.db.utils import IntegrityError
+from django.db import connection
+from django.db.migrations.loader import MigrationLoader
 from django.db.transaction import atomic
 from django.conf import settings
 
 from ..models import (
     Category,
     Problem,
+    ProblemStats,
     Answer,
     Commentary,
     Submission,
@@ -149,6 +154,35 @@ class AnswerModelTestCase(TestCase):
         cached_problem = redis.get(key)
         self.assertEqual(cached_problem.answer.answer, new_answer)
 
+    def test_digest_and_version(self):
+
+        answer = Answer.objects.get(answer="answer")
+        self.assertEqual(answer.version, 1)
+        self.assertEqual(answer.digest, Answer.digest_of("answer", "exact"))
+
+        answer.save()  # not changed
+        self.assertEqual(answer.version, 1)
+
+        answer.normalization = Answer.Normalization.WHITESPACE
+        answer.save(update_fields=["normalization"])
+        answer.refresh_from_db()
+        self.assertEqual(answer.version, 2)
+        self.assertEqual(answer.digest, Answer.digest_of(" answer\n", "whitespace"))
+
+        # by queryset update, no save()
+        Answer.objects.filter(pk=answer.pk).update(answer="updated")
+        answer.refresh_from_db()
+        self.assertEqual(answer.version, 3)
+        self.assertEqual(answer.digest, Answer.digest_of("updated", "whitespace"))
+
+        lines = Answer.Normalization.LINE_ENDINGS
+        self.assertEqual(
+            Answer.digest_of("a  \r\nb\r\n\n", lines), Answer.digest_of("a\nb", lines)
+        )
+        self.assertNotEqual(
+            Answer.digest_of("a b", lines), Answer.digest_of("a  b", lines)
+        )
+
 
 class ProblemModelTestCase(TestCase):
     """
@@ -414,6 +448,53 @@ class SubmissionModelTestCase(TestCase):
         self.assertEqual(prev_n, Submission.objects.count())
 
 
+class ProblemStatsModelTestCase(TestCase):
+    def setUp(self) -> None:
+        create_n_users(3)
+        create_n_categories(1)
+        create_n_problem(2, User.objects.all(), Category.objects.all())
+        create_n_submission(3, User.objects.all(), Problem.objects.all())
+
+    def test_incr(self):
+
+        problem = Problem.objects.first()
+        ProblemStats.objects.incr(problem.pk, submitted=1)
+        ProblemStats.objects.incr(problem.pk, submitted=1, solved=1)
+
+        stats = ProblemStats.objects.get(problem=problem)
+        self.assertEqual(stats.submitted_count, 2)
+        self.assertEqual(stats.solved_count, 1)
+        self.assertEqual(stats.acceptance_rate, 0.5)
+
+    def test_reconcile(self):
+
+        Submission.objects.filter(pk=Submission.objects.first().pk).update(score=100)
+        ProblemStats.objects.incr(Problem.objects.first().pk, submitted=10)
+
+        ProblemStats.objects.reconcile()
+
+        for problem in Problem.objects.all():
+            stats = ProblemStats.objects.get(problem=problem)
+            self.assertEqual(stats.submitted_count, problem.submitted_count())
+            self.assertEqual(stats.solved_count, problem.solved_count())
+        self.assertEqual(ProblemStats.objects.reconcile(), [])
+
+    def test_backfill_migration(self):
+
+        migration = import_module("problems.migrations.0002_problemstats")
+        ProblemStats.objects.all().delete()  # as created by migration
+
+        state = MigrationLoader(connection).project_state(
+            ("problems", "0002_problemstats")
+        )
+        migration.backfill_stats(state.apps, None)
+
+        for problem in Problem.objects.all():
+            stats = ProblemStats.objects.get(problem=problem)
+            self.assertEqual(stats.submitted_count, problem.submitted_count())
+            self.assertEqual(stats.solved_count, problem.solved_count())
+
+
 def create_solution(user, problem, answer):
     try:
         submission = Submission.objects.find_submission_on_problem(problem.id, user)
@@ -463,3 +544,57 @@ class SolutionModelTestCase(TestCase):
         self.assertEqual(prev_n, 1)
         self.assertEqual(prev_n + 1, n)
         self.assertEqual("answer2", Solution.objects.get(answer="answer2").answer)
+
+
+@override_settings(DEBUG_PROBLEM_QUERY_DELAY=0)
+class QueryPlanTestCase(TestCase):
+    """hot queries are served by indexes, no full table scan"""
+
+    def setUp(self) -> None:
+        create_n_users(2)
+        create_n_categories(2)
+        create_n_problem(3, User.objects.all(), Category.objects.all())
+
+    def assertNoFullScan(self, queryset):
+        plan = queryset.explain()
+        for line in plan.splitlines():
+            # 'SCAN table' without index, 'SCAN table USING INDEX' is ok
+            self.assertFalse(
+                re.search(r"\bSCAN \w+$", line.strip()),
+                f"full table scan in plan\n{plan}\nof\n{queryset.query}",
+            )
+
+    def test_list(self):
+
+        ordered = lambda queryset: queryset.order_by("created_at", "id").values("id")
+        self.assertNoFullScan(ordered(Problem.objects.all()))
+        self.assertNoFullScan(ordered(Problem.objects.filter_by_groups([1, 2], [])))
+        self.assertNoFullScan(ordered(Problem.objects.filter_by_groups([1], [1, 2])))
+
+    def test_recommendation(self):
+
+        self.assertNoFullScan(Problem.objects.recommend(5, exclude={1}))
+
+    def test_submission(self):
+
+        user = User.objects.first()
+        problem = Problem.objects.first()
+        self.assertNoFullScan(Submission.objects.filter(problem=problem, score=100))
+        self.assertNoFullScan(
+            Submission.objects.filter(user=user, score=100).values("problem_id")
+        )
+
+    def test_solution_history(self):
+
+        user = User.objects.first()
+        problem = Problem.objects.first()
+        create_submission(user, problem)
+        self.assertNoFullScan(
+            Solution.objects.find_submitted_solutions(problem.pk, user)
+        )
+        self.assertNoFullScan(
+            Solution.objects.filter(
+                submission__problem=problem.pk, submission__user=user.id
+            ).order_by("-created_at", "-id")
+        )
+
@@ -1,8 +1,36 @@
+import asyncio
+import json
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import OperationalError, connection
 from django.db.models import Q
+from django.test import override_settings
 from django.urls import reverse, resolve
+from django.utils import timezone
 from rest_framework.test import APITestCase, APIRequestFactory, APIClient
 
-from ..models import User, Problem, Category, Answer, Commentary
+from config import asgi, redis
+
+from ..index import problem_index
+from ..models import (
+    User,
+    Problem,
+    ProblemStats,
+    Category,
+    Answer,
+    Commentary,
+    Submission,
+    Solution,
+)
+from .. import events, tasks
+from ..tasks import check_answer_and_update_score, grade_pending_solutions
 
 from . import test_models
 
@@ -19,6 +47,10 @@ class ProblemsAPITestCase(APITestCase):
 
     def setUp(self) -> None:
 
+        # invalidation runs on commit, never in test transaction
+        cache.delete_pattern("*")
+        redis.local_cache.clear()
+        problem_index.clear()
         test_models.create_n_categories(self.category_count)
         test_models.create_n_users(self.user_count)
         test_models.create_n_problem(
@@ -92,6 +124,193 @@ class ProblemsAPITestCase(APITestCase):
         problems = Problem.objects.filter()
         self.assertEqual(json["count"], problems.count())
 
+    def test_conditional_get(self):
+
+        response = self.client.get(self.url)
+        etag = response.headers["ETag"]
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        # new problem changes count
+        with self.captureOnCommitCallbacks(execute=True):
+            test_models.create_problem(
+                name="conditional-get",
+                answer="answer",
+                commentary="comment",
+                description="description",
+                level=1,
+                owner=User.objects.first(),
+                category=Category.objects.first(),
+            )
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["count"], self.problem_count + 1)
+
+    @override_settings(RESPONSE_COUNTS_TTL=0)  # render again on every request
+    def test_conditional_get_modified_since(self):
+
+        response = self.client.get(self.url)
+        modified = response.headers["Last-Modified"]
+        ids = [row["id"] for row in response.json()["results"]]
+
+        response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=modified)
+        self.assertEqual(response.status_code, 304)  # same body, same time
+
+        # counts change no 'updated_at'
+        with self.captureOnCommitCallbacks(execute=True):
+            ProblemStats.objects.incr(ids[0], submitted=1)
+        response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=modified)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["results"][0]["submitted_count"], 1)
+        modified = response.headers["Last-Modified"]
+
+        # deletion changes rows of page and count
+        with self.captureOnCommitCallbacks(execute=True):
+            Problem.objects.get(pk=ids[1]).delete()
+        response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=modified)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["count"], self.problem_count - 1)
+
+    def _traverse(self, url):
+        """ids of all cursor pages, and responses"""
+        ids, pages = [], []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            json = response.json()
+            pages.append(json)
+            ids += [row["id"] for row in json["results"]]
+            url = json["next"]
+        return ids, pages
+
+    def test_get_cursor(self):
+
+        ids, pages = self._traverse(f"{self.url}?cursor=")
+        expected = Problem.objects.order_by("created_at", "id")
+        self.assertEqual(ids, [p.id for p in expected])
+        for page in pages:
+            self.assertEqual(page["count"], self.problem_count)
+
+        # with filters
+        ids, pages = self._traverse(f"{self.url}?levels=1,2&categories=1&cursor=")
+        expected = expected.filter(level__in=[1, 2], category=1)
+        self.assertEqual(ids, [p.id for p in expected])
+        self.assertEqual(pages[0]["count"], len(ids))
+
+    def test_get_cursor_without_count(self):
+
+        response = self.client.get(f"{self.url}?cursor=&count=0")
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("count", response.json())
+
+    def test_get_cursor_invalid(self):
+
+        for cursor in ["abc", "bm90LWN1cnNvcg=="]:
+            response = self.client.get(f"{self.url}?cursor={cursor}")
+            self.assertEqual(response.status_code, 400)
+
+    def test_get_cursor_deep_page_queries(self):
+
+        _, pages = self._traverse(f"{self.url}?cursor=")
+        last = pages[-2]["next"]
+
+        # keyset query only, count and snapshots are cached
+        cache.delete_pattern("responses.*")
+        with self.assertNumQueries(1):
+            self.client.get(last)
+
+    def test_get_sparse_fields(self):
+
+        self.client.force_authenticate(User.objects.first())
+        response = self.client.get(f"{self.url}?fields=id,name,solved")
+        self.assertEqual(response.status_code, 200)
+        for row in response.json()["results"]:
+            self.assertEqual(list(row), ["id", "name", "solved"])
+
+        # without id, on page and cursor paths
+        for query in ["fields=solved", "fields=name,solved", "cursor=&fields=solved"]:
+            response = self.client.get(f"{self.url}?{query}")
+            self.assertEqual(response.status_code, 200)
+            expected = [f for f in ["name", "solved"] if f in query]
+            for row in response.json()["results"]:
+                self.assertEqual(list(row), expected)
+
+        response = self.client.get(f"{self.url}recommendation/?limit=2&fields=id")
+        self.assertEqual([list(row) for row in response.json()], [["id"], ["id"]])
+        with override_settings(PROBLEM_INDEX_ENABLED=False):
+            query_response = self.client.get(
+                f"{self.url}recommendation/?limit=2&fields=id"
+            )
+        self.assertEqual(response.json(), query_response.json())
+
+        response = self.client.get(f"{self.url}?fields=id,description")
+        self.assertEqual(response.status_code, 400)
+
+    def test_recommendation(self):
+
+        user = User.objects.first()
+        self.client.force_authenticate(user)
+
+        self.client.get(f"{self.url}recommendation/")  # load index and cache
+        with self.assertNumQueries(0):  # index, solved set and snapshots
+            response = self.client.get(f"{self.url}recommendation/")
+        self.assertEqual(response.status_code, 200)
+
+        problem = Problem.objects.get(pk=response.json()["id"])
+        self.assertEqual(response.json()["submitted_count"], problem.submitted_count())
+        self.assertEqual(response.json()["owner"], problem.owner.username)
+
+    def test_recommendation_order(self):
+
+        user = User.objects.first()
+        self.client.force_authenticate(user)
+        for problem in Problem.objects.order_by("id")[:3]:
+            ProblemStats.objects.incr(problem.pk, submitted=problem.pk)
+        solved = Problem.objects.order_by("level", "-created_at").first()
+        test_models.create_submission(user, solved, score=100)
+
+        response = self.client.get(f"{self.url}recommendation/?limit=5")
+        self.assertEqual(response.status_code, 200)
+        with override_settings(PROBLEM_INDEX_ENABLED=False):
+            with self.assertNumQueries(1):
+                query_response = self.client.get(f"{self.url}recommendation/?limit=5")
+        self.assertEqual(response.json(), query_response.json())
+
+        expected = sorted(
+            Problem.objects.exclude(pk=solved.pk),
+            key=lambda p: (
+                p.level,
+                p.stats.submitted_count if hasattr(p, "stats") else 0,
+                -p.created_at.timestamp(),
+            ),
+        )[:5]
+        self.assertEqual([p["id"] for p in response.json()], [p.pk for p in expected])
+
+    def test_recommendation_invalid_limit(self):
+
+        self.client.force_authenticate(User.objects.first())
+        for limit in ["0", "a", "1000"]:
+            response = self.client.get(f"{self.url}recommendation/?limit={limit}")
+            self.assertEqual(response.status_code, 400)
+
+    def test_get_categories_conditional(self):
+
+        response = self.client.get(f"{self.url}categories/")
+        self.assertEqual(len(response.json()), self.category_count)
+
+        response = self.client.get(
+            f"{self.url}categories/",
+            HTTP_IF_MODIFIED_SINCE=response.headers["Last-Modified"],
+        )
+        self.assertEqual(response.status_code, 304)
+
+    def test_get_with_invalid_queries(self):
+
+        response = self.client.get(f"{self.url}?levels=1,a")
+
+        self.assertEqual(response.status_code, 400)
+
     def test_post_default(self):
 
         name = "post-default"
@@ -157,6 +376,10 @@ class ProblemAPITestCase(APITestCase):
 
     def setUp(self) -> None:
 
+        # invalidation runs on commit, never in test transaction
+        cache.delete_pattern("*")
+        redis.local_cache.clear()
+        problem_index.clear()
         test_models.create_n_categories(self.category_count)
         test_models.create_n_users(self.user_count)
         test_models.create_n_problem(
@@ -177,6 +400,38 @@ class ProblemAPITestCase(APITestCase):
         self.assertEqual(first_problem.category.name, json["category"])
         self.assertEqual(first_problem.level, json["level"])
 
+    def test_get_cached_without_query(self):
+
+        url = f"{self.url(1)}/"
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+        with self.assertNumQueries(0):
+            cached_response = self.client.get(url)
+        self.assertEqual(response.json(), cached_response.json())
+
+    def test_conditional_get(self):
+
+        url = f"{self.url(1)}/"
+        response = self.client.get(url)
+        etag = response.headers["ETag"]
+        self.assertIn("Last-Modified", response.headers)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        # etag changed after update
+        problem = Problem.objects.get(pk=1)
+        problem.name = "conditional-get"
+        with self.captureOnCommitCallbacks(execute=True):
+            problem.save()
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers["ETag"], etag)
+        self.assertEqual(response.json()["name"], "conditional-get")
+
     def test_put_default(self):
 
         first_problem = Problem.objects.first()
@@ -213,4 +468,581 @@ class ProblemAPITestCase(APITestCase):
 class SolutionAPITestCase(APITestCase):
 
     url = lambda self, id: f"/problems/{id}/solutions"
-    pass
+
+    def setUp(self) -> None:
+
+        cache.delete_pattern("*")
+        redis.local_cache.clear()
+        problem_index.clear()
+        test_models.create_n_categories(1)
+        test_models.create_n_users(1)
+        test_models.create_n_problem(1, User.objects.all(), Category.objects.all())
+        self.user = User.objects.first()
+        self.client.force_authenticate(self.user)
+
+    def test_post_counts_submission(self):
+
+        with mock.patch.object(check_answer_and_update_score, "delay"):
+            for _ in range(2):
+                response = self.client.post(f"{self.url(1)}/", {"answer": "wrong"})
+                self.assertEqual(response.status_code, 202)
+
+        stats = ProblemStats.objects.get(problem_id=1)
+        self.assertEqual(stats.submitted_count, 1)  # one submission per user
+        self.assertEqual(stats.solved_count, 0)
+
+    @override_settings(DEBUG_PROBLEM_CHECK_DELAY=0)
+    def test_solved_counted_once(self):
+
+        answer = Problem.objects.get(pk=1).answer.answer
+        with mock.patch.object(check_answer_and_update_score, "delay"):
+            for _ in range(2):
+                response = self.client.post(f"{self.url(1)}/", {"answer": answer})
+                solution_id = int(response.json()["task"]["href"].split("/")[-1])
+                with self.captureOnCommitCallbacks(execute=True):
+                    score = check_answer_and_update_score(1, solution_id)
+                self.assertEqual(score, 100)
+
+        stats = ProblemStats.objects.get(problem_id=1)
+        self.assertEqual(stats.submitted_count, 1)
+        self.assertEqual(stats.solved_count, 1)
+
+    def test_solved_flags_merged_on_shared_response(self):
+
+        solver = test_models.create_user("solver")
+        other = test_models.create_user("other")
+        submission = test_models.create_submission(solver, Problem.objects.get(pk=1))
+        Submission.objects.filter(pk=submission.pk).update(score=100)
+
+        self.client.force_authenticate(solver)
+        response = self.client.get("/problems/")
+        self.assertTrue(response.json()["results"][0]["solved"])
+        solver_etag = response.headers["ETag"]
+        self.assertNotIn("Last-Modified", response.headers)  # not moved by solves
+
+        self.client.force_authenticate(other)
+        response = self.client.get("/problems/")
+        self.assertFalse(response.json()["results"][0]["solved"])
+        self.assertNotEqual(response.headers["ETag"], solver_etag)
+        # single rendered response for every user
+        self.assertEqual(len(cache.keys("responses.*")), 1)
+
+        self.client.force_authenticate(solver)
+        response = self.client.get("/problems/", HTTP_IF_NONE_MATCH=solver_etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_solved_flag_and_permission(self):
+
+        owner = User.objects.first()
+        user = test_models.create_user("solver")
+        self.client.force_authenticate(user)
+
+        response = self.client.get("/problems/")
+        self.assertFalse(response.json()["results"][0]["solved"])
+        response = self.client.get("/problems/1/answer-commentary/")
+        self.assertEqual(response.status_code, 403)
+
+        # solved set is cached, updated by grading
+        submission = test_models.create_submission(user, Problem.objects.get(pk=1))
+        Submission.objects.filter(pk=submission.pk).update(score=100)
+        Submission.objects.add_solved(user.pk, 1)
+
+        response = self.client.get("/problems/")
+        self.assertTrue(response.json()["results"][0]["solved"])
+        with self.assertNumQueries(0):
+            response = self.client.get("/problems/1/answer-commentary/")
+        self.assertEqual(response.status_code, 200)
+
+    def test_solution_history_pages(self):
+
+        with mock.patch.object(check_answer_and_update_score, "delay"):
+            for i in range(5):
+                self.client.post(f"{self.url(1)}/", {"answer": f"answer{i}"})
+
+        answers, url = [], f"{self.url(1)}/?limit=2"
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            json = response.json()
+            self.assertLessEqual(len(json["results"]), 2)
+            answers += [row["answer"] for row in json["results"]]
+            url = json["next"]
+        self.assertEqual(answers, [f"answer{i}" for i in reversed(range(5))])
+
+        response = self.client.get(f"{self.url(1)}/?limit=0")
+        self.assertEqual(response.status_code, 400)
+
+    @override_settings(DEBUG_PROBLEM_CHECK_DELAY=0)
+    def test_solution_state_polled_from_cache(self):
+
+        with mock.patch.object(check_answer_and_update_score, "delay"):
+            response = self.client.post(f"{self.url(1)}/", {"answer": "wrong"})
+        href = response.json()["task"]["href"]
+
+        with self.assertNumQueries(0):
+            response = self.client.get(f"/{href}/")
+        self.assertEqual(response.json()["state"], "check_before")
+
+        with self.captureOnCommitCallbacks(execute=True):  # cached on commit
+            check_answer_and_update_score(1, int(href.split("/")[-1]))
+        with self.assertNumQueries(0):
+            response = self.client.get(f"/{href}/")
+        self.assertEqual(response.json()["state"], "check_done")
+
+        # not cached for other user, nor found
+        self.client.force_authenticate(test_models.create_user("other"))
+        response = self.client.get(f"/{href}/")
+        self.assertEqual(response.status_code, 404)
+
+    @override_settings(DEBUG_PROBLEM_CHECK_DELAY=0, GRADING_BATCH_ENABLED=True)
+    def test_batch_grading(self):
+
+        answer = Problem.objects.get(pk=1).answer.answer
+        other = test_models.create_user("other")
+        with mock.patch.object(grade_pending_solutions, "delay") as delay:
+            for user, given in [(self.user, "wrong"), (self.user, answer)] * 2 + [
+                (other, answer)
+            ]:
+                self.client.force_authenticate(user)
+                self.client.post(f"{self.url(1)}/", {"answer": given})
+        self.assertEqual(delay.call_count, 5)
+
+        # pending, answers from cache, bulk update, submissions, stats
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(grade_pending_solutions(3), 3)
+            self.assertEqual(grade_pending_solutions(), 2)
+        self.assertEqual(grade_pending_solutions(), 0)
+
+        scores = Solution.objects.order_by("id").values_list("score", "state")
+        self.assertEqual([score for score, _ in scores], [0, 100, 0, 100, 100])
+        self.assertEqual({state for _, state in scores}, {Solution.CHECK_DONE})
+        stats = ProblemStats.objects.get(problem_id=1)
+        self.assertEqual((stats.submitted_count, stats.solved_count), (2, 2))
+        self.assertEqual(Submission.objects.solved_problem_ids(other), {1})
+
+        response = self.client.get(f"{self.url(1)}/")
+        self.assertEqual(response.json()["results"][0]["score"], 100)
+
+    @override_settings(DEBUG_PROBLEM_CHECK_DELAY=0)
+    def test_batch_claimed_and_finished_conditionally(self):
+
+        with mock.patch.object(check_answer_and_update_score, "delay"):
+            for _ in range(4):
+                self.client.post(f"{self.url(1)}/", {"answer": "wrong"})
+        claimed, stale, pending, finished = Solution.objects.order_by("id")
+
+        Solution.objects.filter(pk=claimed.pk).update(state=Solution.CHEKING)
+        Solution.objects.filter(pk=stale.pk).update(
+            state=Solution.CHEKING,
+            updated_at=timezone.now()
+            - timedelta(seconds=settings.GRADING_CLAIM_TIMEOUT + 1),
+        )
+
+        def _grade(solutions):
+            # finished by other grading meanwhile
+            Solution.objects.filter(pk=finished.pk).update(state=Solution.CHECK_DONE)
+            return {s.pk: 0 for s in solutions}
+
+        with mock.patch.object(Solution.objects, "grade", side_effect=_grade) as grade:
+            self.assertEqual(grade_pending_solutions(), 2)
+        graded = [s.pk for s in grade.call_args.args[0]]
+        self.assertEqual(graded, [stale.pk, pending.pk, finished.pk])
+
+        states = dict(Solution.objects.values_list("pk", "state"))
+        self.assertEqual(states[claimed.pk], Solution.CHEKING)  # other worker's
+        self.assertEqual(states[stale.pk], Solution.CHECK_DONE)
+        self.assertEqual(states[pending.pk], Solution.CHECK_DONE)
+
+    @override_settings(DEBUG_PROBLEM_CHECK_DELAY=0)
+    def test_batch_graded_outside_transaction(self):
+
+        with mock.patch.object(check_answer_and_update_score, "delay"):
+            self.client.post(f"{self.url(1)}/", {"answer": "wrong"})
+
+        # claimed and committed before grading, no transaction(locks) held
+        depth = len(connection.atomic_blocks)
+        grading = []
+
+        def _grade(solutions):
+            grading.append(
+                (len(connection.atomic_blocks), Solution.objects.get().state)
+            )
+            return {s.pk: 0 for s in solutions}
+
+        with mock.patch.object(Solution.objects, "grade", side_effect=_grade):
+            self.assertEqual(grade_pending_solutions(), 1)
+        self.assertEqual(grading, [(depth, Solution.CHEKING)])
+
+    def test_grade_by_memoized_digest(self):
+
+        answer = Answer.objects.get(problem=1)
+        answer.answer = "a  b\r\n"
+        answer.normalization = Answer.Normalization.WHITESPACE
+        with self.captureOnCommitCallbacks(execute=True):
+            answer.save()
+
+        with mock.patch.object(check_answer_and_update_score, "delay"):
+            for given in ["a b", " a\tb ", "ab"]:
+                self.client.post(f"{self.url(1)}/", {"answer": given})
+        first, duplicated, wrong = Solution.objects.select_related(
+            "submission"
+        ).order_by("id")
+
+        with self.assertNumQueries(1):  # digests of answers, not texts
+            self.assertEqual(Solution.objects.grade([first]), {first.pk: 100})
+        with mock.patch.object(Answer, "digest_of") as digest_of:
+            self.assertEqual(Solution.objects.grade([duplicated]), {duplicated.pk: 100})
+        digest_of.assert_not_called()  # memoized
+        self.assertEqual(Solution.objects.grade([wrong]), {wrong.pk: 0})
+
+        # digest of changed answer, by current answer.
+        # cached snapshot is stale, not invalidated yet.
+        answer.answer = "ab"
+        answer.save()
+        # memo of old answer version is not used
+        self.assertEqual(Solution.objects.grade([duplicated]), {duplicated.pk: 0})
+        wrong.answer_version = 0
+        self.assertEqual(Solution.objects.grade([wrong]), {wrong.pk: 100})
+
+    def test_digest_by_answer_of_database(self):
+
+        Problem.objects.get_cached_snapshot(1)
+        answer = Answer.objects.get(problem=1)
+        answer.normalization = Answer.Normalization.WHITESPACE
+        answer.save()  # cached snapshot is stale, not invalidated yet
+
+        with mock.patch.object(check_answer_and_update_score, "delay"):
+            response = self.client.post(f"{self.url(1)}/", {"answer": " a  b "})
+        self.assertEqual(response.status_code, 202)
+
+        solution = Solution.objects.latest("id")
+        self.assertEqual(solution.answer_version, answer.version)
+        self.assertEqual(
+            solution.digest,
+            Answer.digest_of(" a  b ", Answer.Normalization.WHITESPACE),
+        )
+
+    @override_settings(DEBUG_PROBLEM_CHECK_DELAY=0)
+    def test_inline_grading(self):
+
+        answer = Problem.objects.get(pk=1).answer.answer
+        with mock.patch.object(check_answer_and_update_score, "delay") as delay:
+            response = self.client.post(f"{self.url(1)}/", {"answer": answer})
+            self.assertEqual(response.status_code, 202)  # not memoized yet
+            solution_id = int(response.json()["task"]["href"].split("/")[-1])
+            with self.captureOnCommitCallbacks(execute=True):
+                check_answer_and_update_score(1, solution_id)
+
+            # duplicated answer, graded in request
+            response = self.client.post(f"{self.url(1)}/", {"answer": answer})
+            self.assertEqual(response.status_code, 201)
+            self.assertEqual(response.json()["solution"]["score"], 100)
+            self.assertEqual(response.json()["solution"]["state"], Solution.CHECK_DONE)
+            self.assertEqual(delay.call_count, 1)
+
+            with override_settings(INLINE_GRADING_ENABLED=False):
+                response = self.client.post(f"{self.url(1)}/", {"answer": answer})
+            self.assertEqual(response.status_code, 202)
+
+            # under load, all slots taken
+            with mock.patch.object(tasks._inline_slots, "acquire", return_value=False):
+                response = self.client.post(f"{self.url(1)}/", {"answer": answer})
+            self.assertEqual(response.status_code, 202)
+
+            with override_settings(INLINE_GRADING_MAX_LENGTH=len(answer) - 1):
+                response = self.client.post(f"{self.url(1)}/", {"answer": answer})
+            self.assertEqual(response.status_code, 202)
+            self.assertEqual(delay.call_count, 4)
+
+            # answer changed, snapshot not invalidated yet. memo is of old one.
+            Answer.objects.filter(problem=1).update(answer=f"{answer}, changed")
+            response = self.client.post(f"{self.url(1)}/", {"answer": answer})
+            self.assertEqual(response.status_code, 202)
+            self.assertEqual(delay.call_count, 5)
+
+        stats = ProblemStats.objects.get(problem_id=1)
+        self.assertEqual(stats.solved_count, 1)
+
+    @override_settings(DEBUG_PROBLEM_CHECK_DELAY=0)
+    def test_grading_idempotent(self):
+
+        answer = Problem.objects.get(pk=1).answer.answer
+        with mock.patch.object(check_answer_and_update_score, "delay"):
+            self.client.post(f"{self.url(1)}/", {"answer": answer})
+        solution = Solution.objects.get()
+
+        # redelivered, graded once
+        with mock.patch.object(
+            Solution.objects, "grade", wraps=Solution.objects.grade
+        ) as grade:
+            with self.captureOnCommitCallbacks(execute=True):
+                for _ in range(2):
+                    score = check_answer_and_update_score(1, solution.pk)
+                    self.assertEqual(score, 100)
+        self.assertEqual(grade.call_count, 1)
+        self.assertEqual(ProblemStats.objects.get(problem_id=1).solved_count, 1)
+
+        # claimed by other worker, graded by it
+        Solution.objects.filter(pk=solution.pk).update(state=Solution.CHEKING)
+        self.assertIsNone(check_answer_and_update_score(1, solution.pk))
+
+        # worker gone, claimed again after timeout
+        stale = timezone.now() - timedelta(seconds=settings.GRADING_CLAIM_TIMEOUT + 1)
+        Solution.objects.filter(pk=solution.pk).update(updated_at=stale)
+        self.assertEqual(check_answer_and_update_score(1, solution.pk), 100)
+        self.assertEqual(ProblemStats.objects.get(problem_id=1).solved_count, 1)
+
+    def test_grading_released_on_database_error(self):
+
+        with mock.patch.object(check_answer_and_update_score, "delay"):
+            self.client.post(f"{self.url(1)}/", {"answer": "wrong"})
+        solution = Solution.objects.get()
+
+        with mock.patch.object(Solution.objects, "grade", side_effect=OperationalError):
+            with self.assertRaises(OperationalError):
+                check_answer_and_update_score(1, solution.pk)
+        solution.refresh_from_db()
+        self.assertEqual(solution.state, Solution.CHECK_BEFORE)  # for retry
+
+    @override_settings(DEBUG_PROBLEM_CHECK_DELAY=0)
+    def test_grading_retried_after_submission_update_failed(self):
+
+        answer = Problem.objects.get(pk=1).answer.answer
+        with mock.patch.object(check_answer_and_update_score, "delay"):
+            self.client.post(f"{self.url(1)}/", {"answer": answer})
+        solution = Solution.objects.get()
+
+        # solution finished, then submission update failed
+        with mock.patch.object(
+            Submission.objects, "filter", side_effect=OperationalError
+        ):
+            with self.assertRaises(OperationalError):
+                check_answer_and_update_score(1, solution.pk)
+        solution.refresh_from_db()
+        self.assertEqual(solution.state, Solution.CHECK_BEFORE)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(check_answer_and_update_score(1, solution.pk), 100)
+        self.assertEqual(Submission.objects.get().score, 100)
+        self.assertEqual(ProblemStats.objects.get(problem_id=1).solved_count, 1)
+
+    def test_bench_grading(self):
+
+        with mock.patch.object(check_answer_and_update_score, "delay"):
+            self.client.post(f"{self.url(1)}/", {"answer": "real"})
+        real = Solution.objects.get()
+
+        out = StringIO()
+        with mock.patch("config.pubsub.get_redis_connection") as connection:
+            call_command("bench_grading", "--solutions", "10", stdout=out)
+        self.assertIn("per task", out.getvalue())
+        self.assertIn("batch", out.getvalue())
+        connection.assert_not_called()  # no events to clients
+        self.assertEqual(Solution.objects.get(), real)  # rolled back
+        real.refresh_from_db()
+        self.assertEqual(real.state, Solution.CHECK_BEFORE)  # not claimed
+        # not left in cache, state of real one only
+        self.assertEqual(cache.keys("solutions.*"), [f"solutions.{real.pk}"])
+        self.assertEqual(cache.keys("verdicts.*"), [])
+
+
+@override_settings(PUBSUB_BACKEND="local", DEBUG_PROBLEM_CHECK_DELAY=0)
+class SolutionEventsTestCase(APITestCase):
+    def setUp(self) -> None:
+
+        cache.delete_pattern("*")
+        redis.local_cache.clear()
+        test_models.create_n_categories(1)
+        test_models.create_n_users(2)
+        test_models.create_n_problem(1, User.objects.all(), Category.objects.all())
+        self.user = User.objects.first()
+        self.client.force_login(self.user)
+
+        answer = Problem.objects.get(pk=1).answer.answer
+        with mock.patch.object(check_answer_and_update_score, "delay"):
+            response = self.client.post("/problems/1/solutions/", {"answer": answer})
+        self.solution_id = int(response.json()["task"]["href"].split("/")[-1])
+        self.cookie = f"sessionid={self.client.cookies['sessionid'].value}"
+
+    def _grade(self):
+        with self.captureOnCommitCallbacks(execute=True):  # done state on commit
+            check_answer_and_update_score(1, self.solution_id)
+
+    def _get(self, path, cookie=None, accept=b"*/*", during=None):
+        """(status, body) of events app, during() is called while waiting"""
+
+        async def run():
+            sent = []
+            headers = [(b"accept", accept), (b"cookie", (cookie or "").encode())]
+            scope = {
+                "type": "http",
+                "method": "GET",
+                "path": path,
+                "query_string": b"",
+                "headers": headers,
+            }
+            disconnect = asyncio.Event()
+
+            async def receive():
+                await disconnect.wait()
+                return {"type": "http.disconnect"}
+
+            async def send(message):
+                sent.append(message)
+
+            app = asyncio.ensure_future(asgi.application(scope, receive, send))
+            if during is not None:
+                while self.solution_id not in events.waiters:
+                    await asyncio.sleep(0.01)
+                await sync_to_async(during)()
+            await asyncio.wait_for(app, 5)
+            body = b"".join(m.get("body", b"") for m in sent[1:])
+            return sent[0]["status"], body.decode()
+
+        return async_to_sync(run)()
+
+    def test_stream_states(self):
+
+        path = f"/problems/1/solutions/{self.solution_id}/events"
+        status, body = self._get(
+            path,
+            self.cookie,
+            b"text/event-stream",
+            during=self._grade,
+        )
+        self.assertEqual(status, 200)
+        states = [
+            json.loads(line[len("data: ") :])
+            for line in body.split("\n")
+            if line.startswith("data: ")
+        ]
+        self.assertEqual(
+            [(e["state"], e["score"]) for e in states],
+            [
+                (Solution.CHECK_BEFORE, 0),
+                (Solution.CHEKING, 0),
+                (Solution.CHECK_DONE, 100),
+            ],
+        )
+
+        # done before, single event from database
+        cache.delete_pattern("*")
+        status, body = self._get(path, self.cookie, b"text/event-stream")
+        self.assertEqual(body.count("event: state"), 1)
+
+    def test_long_poll(self):
+
+        path = f"/problems/1/solutions/{self.solution_id}/events"
+        status, body = self._get(
+            path,
+            self.cookie,
+            during=self._grade,
+        )
+        self.assertEqual(status, 200)
+        self.assertEqual(
+            json.loads(body),
+            {"id": self.solution_id, "state": Solution.CHECK_DONE, "score": 100},
+        )
+
+        with override_settings(SOLUTION_EVENTS_TIMEOUT=0):
+            Solution.objects.filter(pk=self.solution_id).update(state=Solution.CHEKING)
+            cache.delete_pattern("*")
+            status, body = self._get(path, self.cookie)
+        self.assertEqual(json.loads(body)["state"], Solution.CHEKING)
+
+    def test_not_authorized(self):
+
+        path = f"/problems/1/solutions/{self.solution_id}/events"
+        self.assertEqual(self._get(path)[0], 401)
+
+        self.client.force_login(User.objects.last())  # not of this user
+        cookie = f"sessionid={self.client.cookies['sessionid'].value}"
+        self.assertEqual(self._get(path, cookie)[0], 404)
+        self.assertEqual(self._get("/problems/1/solutions/999/events", cookie)[0], 404)
+        self.assertFalse(self.solution_id in events.waiters)
+
+
+class ProblemImportAPITestCase(APITestCase):
+
+    url = "/problems/import/"
+
+    def setUp(self) -> None:
+
+        cache.delete_pattern("*")
+        redis.local_cache.clear()
+        problem_index.clear()
+        test_models.create_n_categories(1)
+        test_models.create_n_users(1)
+        test_models.create_n_problem(1, User.objects.all(), Category.objects.all())
+        self.client.force_authenticate(User.objects.first())
+
+    def _row(self, name, **kwargs):
+        row = {
+            "name": name,
+            "level": 1,
+            "description": "description",
+            "category": Category.objects.first().pk,
+            "answer": {"answer": "answer"},
+            "commentary": {"comment": "comment"},
+        }
+        row.update(kwargs)
+        return row
+
+    def test_import_json(self):
+
+        self.client.get("/problems/")  # cached list
+        rows = [self._row(f"import{i}") for i in range(20)]
+        rows += [
+            self._row(Problem.objects.first().name),  # taken
+            self._row("import0"),  # duplicated in batch
+            self._row("bad-level", level=9),
+            self._row("bad-category", category=999),
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            # names, categories, savepoint and 3 bulk inserts, no query per row
+            with self.assertNumQueries(7):
+                response = self.client.post(self.url, rows, format="json")
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.json()["created"]), 20)
+        errors = response.json()["errors"]
+        self.assertEqual([e["row"] for e in errors], [20, 21, 22, 23])
+        self.assertIn("name", errors[0]["errors"])
+        self.assertIn("level", errors[2]["errors"])
+        self.assertIn("category", errors[3]["errors"])
+
+        problem = Problem.objects.get(name="import3")
+        self.assertEqual(problem.answer.answer, "answer")
+        self.assertEqual(problem.owner, User.objects.first())
+        self.assertEqual(self.client.get("/problems/").json()["count"], 21)
+
+    def test_import_ndjson(self):
+
+        lines = [json.dumps(self._row(f"import{i}")) for i in range(3)]
+        body = "\n".join(lines + ["{not json", ""])
+        response = self.client.post(self.url, body, content_type="application/x-ndjson")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.json()["created"]), 3)
+        self.assertEqual(response.json()["errors"][0]["row"], 3)
+
+        # nothing to create
+        response = self.client.post(self.url, [{"name": "x"}], format="json")
+        self.assertEqual(response.status_code, 400)
+
+    def test_import_command(self):
+
+        with tempfile.NamedTemporaryFile("w", suffix=".ndjson") as file:
+            for i in range(3):
+                file.write(json.dumps(self._row(f"command{i}")) + "\n")
+            file.flush()
+            out = StringIO()
+            call_command(
+                "import_problems",
+                file.name,
+                "--owner",
+                User.objects.first().username,
+                stdout=out,
+            )
+
+        self.assertIn("imported 3 problems, 0 errors", out.getvalue())
+        self.assertEqual(Problem.objects.filter(name__startswith="command").count(), 3)
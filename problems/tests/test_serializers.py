@@ -0,0 +1,51 @@
+from datetime import datetime, timezone
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+from rest_framework.renderers import JSONRenderer
+
+from config.renderers import FastJSONRenderer
+
+from ..models import User, Problem, ProblemStats, Category
+from ..serializers import ProblemListSerializer
+
+from . import test_models
+
+
+class ProblemListValuesTestCase(TestCase):
+    def setUp(self) -> None:
+        test_models.create_n_categories(2)
+        test_models.create_n_users(2)
+        test_models.create_n_problem(5, User.objects.all(), Category.objects.all())
+        ProblemStats.objects.incr(1, submitted=3, solved=1)
+        Problem.objects.filter(pk=2).update(category=None)
+
+    def test_same_as_serializer(self):
+
+        problems = Problem.objects.with_counts().order_by("id")
+        expected = ProblemListSerializer(problems, many=True).data
+        rows = [ProblemListSerializer.from_values(r) for r in problems.list_values()]
+        self.assertEqual(rows, [dict(row) for row in expected])
+
+    def test_fast_renderer_same_output(self):
+
+        data = {
+            "results": [
+                ProblemListSerializer.from_values(r)
+                for r in Problem.objects.with_counts().list_values()
+            ],
+            "name": "한글",
+            "at": datetime(2023, 3, 3, tzinfo=timezone.utc),
+            1: None,
+        }
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEqual(FastJSONRenderer().render(None), b"")
+
+    def test_bench_list(self):
+
+        out = StringIO()
+        call_command("bench_list", "--repeat", "1", stdout=out)
+        self.assertIn("5 rows", out.getvalue())
+        self.assertIn("snapshots", out.getvalue())
+        self.assertIn("render fast", out.getvalue())
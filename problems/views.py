@@ -1,12 +1,22 @@
+from django.conf import settings
+from django.db.models.functions import Length
+
 from rest_framework.permissions import (
     IsAuthenticatedOrReadOnly,
     IsAuthenticated,
     SAFE_METHODS,
 )
-from rest_framework.exceptions import NotFound
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.parsers import JSONParser
 from rest_framework.response import Response
-from rest_framework.status import HTTP_204_NO_CONTENT, HTTP_202_ACCEPTED
+from rest_framework.status import (
+    HTTP_201_CREATED,
+    HTTP_202_ACCEPTED,
+    HTTP_204_NO_CONTENT,
+    HTTP_400_BAD_REQUEST,
+)
+from rest_framework.utils.urls import replace_query_param
 from rest_framework.viewsets import ModelViewSet
 from rest_framework.decorators import action
 
@@ -17,20 +27,31 @@ from .serializers import (
     CategorySerializer,
     ProblemListSerializer,
     ProblemCreateUpdateSerializer,
+    ProblemSnapshotSerializer,
+    ProblemImportSerializer,
     SubmissionSerializer,
     SolutionSerializer,
 )
-from .models import Problem, Category, Submission, Solution
+from .models import (
+    Answer,
+    Problem,
+    Category,
+    Submission,
+    Solution,
+    parse_values,
+    VERSION_KEY,
+    CATEGORIES_VERSION_KEY,
+)
+from .imports import NDJSONParser, import_problems
+from .index import problem_index
+from .pagination import KeysetPagination, encode_cursor, decode_cursor
+from .responses import cached_json_response
 from .permissions import IsOwnerOrReadOnly, IsOwnerOrSolvedUserReadOnly
-from .filters import (
-    NotSolvedProblemsFilter,
-    MinLevelProblemFilter,
-    LessSubmittedProblemFilter,
-    LastestProblemFilter,
-)  ### recommendation api
-
-from .tasks import check_answer_and_update_score
-
+from .tasks import (
+    check_answer_and_update_score,
+    grade_inline,
+    grade_pending_solutions,
+)
 
 id_parameter = openapi.Parameter(
     "id",
@@ -44,12 +65,42 @@ level_parameter = openapi.Parameter(
     description="Level query parameters with integer and comma separated. ex) 'levels=1,2' for level 1 and 2",
     type=openapi.TYPE_STRING,
 )
+limit_parameter = openapi.Parameter(
+    name="limit",
+    in_=openapi.IN_QUERY,
+    description=f"Number of recommended problems, at most {settings.RECOMMENDATION_MAX_LIMIT}. list is returned if given.",
+    type=openapi.TYPE_INTEGER,
+)
 category_parameter = openapi.Parameter(
     name="categories",
     in_=openapi.IN_QUERY,
     description="Category query parameters with integer and comma separated. ex) 'categories=1,2' for category 1 and 2",
     type=openapi.TYPE_STRING,
 )
+cursor_parameter = openapi.Parameter(
+    name="cursor",
+    in_=openapi.IN_QUERY,
+    description="Cursor pagination, ordered by created time. empty for first page, then 'next' of previous page.",
+    type=openapi.TYPE_STRING,
+)
+count_parameter = openapi.Parameter(
+    name="count",
+    in_=openapi.IN_QUERY,
+    description="'0' to omit total count, with cursor only.",
+    type=openapi.TYPE_INTEGER,
+)
+fields_parameter = openapi.Parameter(
+    name="fields",
+    in_=openapi.IN_QUERY,
+    description="Comma separated fields of each problem to return, all by default. ex) 'fields=id,name'",
+    type=openapi.TYPE_STRING,
+)
+history_limit_parameter = openapi.Parameter(
+    name="limit",
+    in_=openapi.IN_QUERY,
+    description=f"Number of solutions per page, {settings.SOLUTION_HISTORY_PAGE_SIZE} by default, at most {settings.SOLUTION_HISTORY_MAX_LIMIT}.",
+    type=openapi.TYPE_INTEGER,
+)
 not_found_response = openapi.Response("not found")
 bad_request_response = openapi.Response("bad request")
 
@@ -83,18 +134,50 @@ class ProblemViewSet(ModelViewSet):
             return ProblemCreateUpdateSerializer
         return super().get_serializer_class()
 
+    def get_filter_params(self):
+        """
+        parsed url parameters, levels and categories
+        """
+        try:
+            levels = parse_values(self.request.query_params.get("levels", ""))
+            categories = parse_values(self.request.query_params.get("categories", ""))
+        except ValueError:
+            raise ValidationError(
+                "levels and categories must be comma separated integers."
+            )
+        return levels, categories
+
+    def get_fields(self, extra=()):
+        """
+        fields of problems to return, parsed '?fields=' sparse fieldset.
+        None for all. extra : allowed fields other than ProblemListSerializer.
+        """
+        fields = self.request.query_params.get("fields")
+        if not fields:
+            return None
+
+        fields = tuple(field.strip() for field in fields.split(","))
+        unknown = set(fields) - set(ProblemListSerializer.Meta.fields) - set(extra)
+        if unknown:
+            raise ValidationError(f"unknown fields, {', '.join(sorted(unknown))}.")
+        return fields
+
     def get_queryset(self):
         """
         queryset from filtered by url parameters, levels and categories
         """
-        levels = self.request.query_params.get("levels", "")
-        categories = self.request.query_params.get("categories", "")
-        return Problem.objects.get_cached_queryset(levels=levels, categories=categories)
+        return Problem.objects.filter_by_groups(*self.get_filter_params())
 
     def get_object(self):
+        """
+        cached snapshot(dict) for read, model instance for write.
+        """
         id = self.kwargs["pk"]
         try:
-            obj = Problem.objects.get_cached_problem(id)
+            if self.request.method in SAFE_METHODS:
+                obj = Problem.objects.get_cached_snapshot(id)
+            else:
+                obj = Problem.objects.get(pk=id)
         except Problem.DoesNotExist:
             raise NotFound
 
@@ -109,7 +192,13 @@ class ProblemViewSet(ModelViewSet):
 
     @swagger_auto_schema(
         operation_description="GET problems with query parameters",
-        manual_parameters=[level_parameter, category_parameter],
+        manual_parameters=[
+            level_parameter,
+            category_parameter,
+            cursor_parameter,
+            count_parameter,
+            fields_parameter,
+        ],
         paginator=PageNumberPagination,
         responses={
             # TODO : paginated response..
@@ -120,7 +209,61 @@ class ProblemViewSet(ModelViewSet):
         },
     )
     def list(self, request, *args, **kwargs):
-        return super().list(request, *args, **kwargs)
+        # paginate cached ids, then fetch problems of the page only.
+        if KeysetPagination.is_requested(request):
+            paginator = KeysetPagination()
+            page = paginator.paginate(request, *self.get_filter_params())
+            get_paginated_response = paginator.get_paginated_response
+            pagination = (paginator.count, paginator.next_cursor)
+        else:
+            if settings.PROBLEM_INDEX_ENABLED:
+                ids = problem_index.filter(*self.get_filter_params())
+            else:
+                ids = Problem.objects.get_cached_ids(*self.get_filter_params())
+            page = self.paginate_queryset(ids)
+            get_paginated_response = self.get_paginated_response
+            pagination = len(ids)
+
+        # 'solved' flag of each row for authenticated user, merged on request.
+        fields = self.get_fields(extra=("solved",))
+        solved = None
+        if request.user.is_authenticated and (not fields or "solved" in fields):
+            solved = Submission.objects.solved_problem_ids(request.user)
+        columns = fields and tuple(f for f in fields if f != "solved")
+        # shared rows keep id for flags, dropped after merged if not asked.
+        hidden_id = solved is not None and columns is not None and "id" not in columns
+        if hidden_id:
+            columns = ("id", *columns)
+
+        def _render():
+            snapshots = Problem.objects.get_cached_snapshots(page)
+            data = [
+                ProblemSnapshotSerializer.list_representation(s, columns)
+                for s in snapshots
+            ]
+            return get_paginated_response(data).data
+
+        def _merge(data):
+            for row in data["results"]:
+                row["solved"] = row["id"] in solved
+                if hidden_id:
+                    del row["id"]
+            return data
+
+        version_keys = [VERSION_KEY.format(id) for id in page]
+        validator = (pagination, tuple(page))
+        personal = None
+        if solved is not None:
+            personal = (tuple(id in solved for id in page), _merge)
+        # counts of submissions bump no version, stale until short ttl.
+        return cached_json_response(
+            request,
+            version_keys,
+            _render,
+            validator,
+            timeout=settings.RESPONSE_COUNTS_TTL,
+            personal=personal,
+        )
 
     @swagger_auto_schema(
         operation_description="GET problem with given id",
@@ -128,7 +271,14 @@ class ProblemViewSet(ModelViewSet):
         responses={"404": not_found_response},
     )
     def retrieve(self, request, *args, **kwargs):
-        return super().retrieve(request, *args, **kwargs)
+        def _render():
+            snapshot = self.get_object()
+            return ProblemSnapshotSerializer.list_representation(snapshot)
+
+        version_keys = [VERSION_KEY.format(self.kwargs["pk"])]
+        return cached_json_response(
+            request, version_keys, _render, timeout=settings.RESPONSE_COUNTS_TTL
+        )
 
     @swagger_auto_schema(
         operation_description="Add problem api. Only authenticated user can add problem. ",
@@ -207,13 +357,46 @@ class ProblemViewSet(ModelViewSet):
         serializer_class=ProblemCreateUpdateSerializer,
     )
     def answer_commentary(self, request, pk=None):
-        try:
-            obj = Problem.objects.get_cached_problem(pk)
-        except Problem.DoesNotExist:
-            raise NotFound
+        snapshot = self.get_object()
+        return Response(ProblemSnapshotSerializer.detail_representation(snapshot))
 
-        serializer = self.get_serializer(obj)
-        return Response(serializer.data)
+    @swagger_auto_schema(
+        operation_description=f"""
+        Import problems in bulk, owned by request user.\n
+        body is json array, or ndjson(application/x-ndjson) of problems,
+        at most {settings.PROBLEM_IMPORT_MAX_ROWS}.\n
+        valid rows are created in single transaction, and errors of others are
+        reported with row number.""",
+        request_body=ProblemImportSerializer(many=True),
+        responses={
+            "201": openapi.Response("created, {'created': ids, 'errors': errors}"),
+            "400": openapi.Response(
+                "nothing created, {'created': [], 'errors': errors}"
+            ),
+        },
+    )
+    @action(
+        methods=["post"],
+        detail=False,
+        url_path="import",
+        url_name="import",
+        permission_classes=[IsAuthenticated],
+        parser_classes=[JSONParser, NDJSONParser],
+        serializer_class=ProblemImportSerializer,
+        pagination_class=None,
+    )
+    def bulk_import(self, request):
+        rows = request.data
+        if not isinstance(rows, list):
+            raise ValidationError("array of problems, or ndjson expected.")
+        if len(rows) > settings.PROBLEM_IMPORT_MAX_ROWS:
+            raise ValidationError(
+                f"at most {settings.PROBLEM_IMPORT_MAX_ROWS} problems at once."
+            )
+
+        report = import_problems(rows, request.user)
+        status = HTTP_201_CREATED if report["created"] else HTTP_400_BAD_REQUEST
+        return Response(report, status=status)
 
     @swagger_auto_schema(
         operation_description="Get all categories data.",
@@ -229,17 +412,26 @@ class ProblemViewSet(ModelViewSet):
     )
     def categories(self, request):
         """categories of problem"""
-        serializer = CategorySerializer(Category.objects.all(), many=True)
-        return Response(serializer.data)
+
+        def _render():
+            return CategorySerializer(Category.objects.all(), many=True).data
+
+        return cached_json_response(request, [CATEGORIES_VERSION_KEY], _render)
 
     @swagger_auto_schema(
         operation_description="""
-        Recommend single problem.\n
+        Recommend single problem, or list of 'limit' problems.\n
         given problem is follow order in below.\n
         1. lowest level.\n
         2. less subbmited.\n
         3. latest added problem.\n
         and not solved problem.""",
+        manual_parameters=[
+            limit_parameter,
+            level_parameter,
+            category_parameter,
+            fields_parameter,
+        ],
         responses={
             "200": openapi.Response(
                 "success description", schema=ProblemListSerializer()
@@ -252,22 +444,42 @@ class ProblemViewSet(ModelViewSet):
         detail=False,
         url_path="recommendation",
         url_name="recommendation",
-        filter_backends=[
-            NotSolvedProblemsFilter,
-            MinLevelProblemFilter,
-            LessSubmittedProblemFilter,
-            LastestProblemFilter,
-        ],
         pagination_class=None,
     )
     def recommendation(self, request):
         """recommendate problem to user"""
-        queryset = self.filter_queryset(self.get_queryset())
-        if queryset.exists():
-            serializer = self.get_serializer(queryset.first())
-            return Response(serializer.data)
+        limit = request.query_params.get("limit")
+        try:
+            n = int(limit) if limit is not None else 1
+        except ValueError:
+            n = 0
+        if not 1 <= n <= settings.RECOMMENDATION_MAX_LIMIT:
+            raise ValidationError(
+                f"limit must be integer in [1, {settings.RECOMMENDATION_MAX_LIMIT}]."
+            )
 
-        return Response(status=HTTP_204_NO_CONTENT)
+        solved = set()
+        if request.user.is_authenticated:
+            solved = Submission.objects.solved_problem_ids(request.user)
+
+        params = self.get_filter_params()
+        columns = self.get_fields()
+        if settings.PROBLEM_INDEX_ENABLED:
+            ids = problem_index.recommend(n, *params, exclude=solved)
+            data = [
+                ProblemSnapshotSerializer.list_representation(snapshot, columns)
+                for snapshot in Problem.objects.get_cached_snapshots(ids)
+            ]
+        else:
+            # dicts from needed columns only, no model instances
+            rows = Problem.objects.recommend(n, *params, exclude=solved).list_values()
+            data = [ProblemListSerializer.from_values(row) for row in rows]
+            if columns:
+                data = [{field: row[field] for field in columns} for row in data]
+
+        if not data:
+            return Response(status=HTTP_204_NO_CONTENT)
+        return Response(data[0] if limit is None else data)
 
     @swagger_auto_schema(
         operation_description="Brief information of submitted solution to problem by user",
@@ -296,11 +508,14 @@ class ProblemViewSet(ModelViewSet):
 
     @swagger_auto_schema(
         method="get",
-        operation_description="""API to list-up solutions which user submit to problem.""",
-        manual_parameters=[id_parameter],
+        operation_description="""
+        API to list-up solutions which user submit to problem, latest first.\n
+        paginated by cursor, follow 'next' for older solutions.""",
+        manual_parameters=[id_parameter, cursor_parameter, history_limit_parameter],
         responses={
             "200": openapi.Response(
-                "success response", schema=SolutionSerializer(many=True)
+                "success response, {'next': url, 'results': solutions}",
+                schema=SolutionSerializer(many=True),
             ),
             "204": openapi.Response("success, but use not submit any solution."),
         },
@@ -311,6 +526,9 @@ class ProblemViewSet(ModelViewSet):
         manual_parameters=[id_parameter],
         request_body=SolutionSerializer,
         responses={
+            "201": openapi.Response(
+                "graded inline, {'task': {'href': url}, 'solution': solution}",
+            ),
             "202": openapi.Response(
                 "success response",  # TODO : dict to schema
             ),
@@ -327,29 +545,90 @@ class ProblemViewSet(ModelViewSet):
     )
     def solutions_list_post(self, request, pk):
         def _list(self, request, pk):
+            limit = request.query_params.get(
+                "limit", settings.SOLUTION_HISTORY_PAGE_SIZE
+            )
             try:
-                obj = Solution.objects.find_submitted_solutions(pk, self.request.user)
-            except Solution.DoesNotExist:
+                limit = int(limit)
+            except ValueError:
+                limit = 0
+            if not 1 <= limit <= settings.SOLUTION_HISTORY_MAX_LIMIT:
+                raise ValidationError(
+                    f"limit must be integer in [1, {settings.SOLUTION_HISTORY_MAX_LIMIT}]."
+                )
+            cursor = decode_cursor(request.query_params.get("cursor"))
+
+            # one more row tells whether next page exists.
+            solutions = Solution.objects.history(
+                pk, request.user, cursor=cursor, limit=limit + 1
+            )
+            if not solutions and cursor is None:
                 return Response(status=HTTP_204_NO_CONTENT)
 
+            next = None
+            if len(solutions) > limit:
+                solutions = solutions[:limit]
+                last = solutions[-1]
+                next = replace_query_param(
+                    request.build_absolute_uri(),
+                    "cursor",
+                    encode_cursor(last.created_at, last.id),
+                )
+
+            solutions = Solution.objects.with_cached_states(solutions)
             return Response(
-                self.get_serializer(obj, many=True).data,
+                {
+                    "next": next,
+                    "results": self.get_serializer(solutions, many=True).data,
+                }
             )
 
         def _post(self, request, pk):
+            # policy and version of answer from database, never stale snapshot.
+            answer = (
+                Answer.objects.filter(problem=pk)
+                .values("normalization", "version", length=Length("answer"))
+                .first()
+            )
+            if answer is None:
+                raise NotFound
 
             serializer = self.get_serializer(data=request.data)
             serializer.is_valid(raise_exception=True)
-            self.perform_create(serializer)
-
-            solution_id = serializer.data["id"]
 
-            ret = check_answer_and_update_score.delay(pk, solution_id)
+            # digest by answer policy of problem, graded without answer text.
+            # regraded by current answer if version differs when graded.
+            serializer.save(
+                digest=Answer.digest_of(
+                    serializer.validated_data["answer"], answer["normalization"]
+                ),
+                answer_version=answer["version"],
+            )
+            solution = serializer.instance
+            solution_id = solution.pk
+            href = f"problems/{pk}/solutions/{solution_id}"
+
+            # final verdict in response, for memoized cheap answer.
+            if grade_inline(solution, answer) is not None:
+                return Response(
+                    {
+                        "task": {"href": href},
+                        "solution": self.get_serializer(solution).data,
+                    },
+                    status=HTTP_201_CREATED,
+                )
+
+            Solution.objects.cache_state(solution)
+            if settings.GRADING_BATCH_ENABLED:
+                # drained with other pending solutions
+                ret = grade_pending_solutions.delay()
+            else:
+                ret = check_answer_and_update_score.delay(pk, solution_id)
 
             return Response(
                 {
                     "task": {
-                        "href": f"problems/{pk}/solutions/{solution_id}",
+                        "href": href,
                     }
                 },
                 status=HTTP_202_ACCEPTED,
@@ -359,7 +638,9 @@ class ProblemViewSet(ModelViewSet):
         return method(self, request, pk)
 
     @swagger_auto_schema(
-        operation_description="""""",
+        operation_description="""
+        API to get solution, poll this until state is 'check_done'.\n
+        state of solution in grading is read from cache.""",
         manual_parameters=[
             id_parameter,
             openapi.Parameter(
@@ -385,10 +666,16 @@ class ProblemViewSet(ModelViewSet):
         ],
     )
     def solutions_id(self, request, pk, solution_id):
+        # polled while grading, from redis
+        obj = Solution.objects.get_cached_state(pk, solution_id, request.user)
+        if obj is not None:
+            return Response(self.serializer_class(obj).data)
+
         try:
-            obj = Solution.objects.find_submitted_solutions(pk, self.request.user)
-        except Solution.DoesNotExist:
-            return Response(status=HTTP_204_NO_CONTENT)
+            obj = Solution.objects.get(
+                pk=solution_id, submission__problem=pk, submission__user=request.user.id
+            )
+        except (Solution.DoesNotExist, ValueError):
+            raise NotFound
 
-        obj = obj.get(pk=solution_id)
         return Response(self.serializer_class(obj).data)
@@ -0,0 +1,145 @@
+"""
+Cache warm up after deploy or redis flush.
+preloads every problem snapshot and popular problem lists,
+see 'python manage.py warm_cache'.
+"""
+import logging
+import pickle
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections
+
+from config import redis  # custom redis interface
+
+from .models import Problem, PROBLEM_KEY
+
+logger = logging.getLogger(__name__)
+
+# bytes, key and pickled array header of cached list, rough
+LIST_OVERHEAD = 128
+
+
+def _problem_rows():
+    """(id, level, category_id) of every problem, single query"""
+    problems = Problem.objects.order_by("id")
+    return list(problems.values_list("id", "level", "category_id"))
+
+
+def popular_filters(rows):
+    """(levels, categories) of popular lists, no filter, each level and category"""
+    levels = sorted({level for _, level, _ in rows})
+    categories = sorted({category for _, _, category in rows if category is not None})
+    return (
+        [([], [])]
+        + [([level], []) for level in levels]
+        + [([], [category]) for category in categories]
+    )
+
+
+def _run(func, items, concurrency):
+    """map func over items with at most concurrency threads"""
+    if concurrency <= 1:
+        return [func(item) for item in items]
+
+    def _work(item):
+        try:
+            return func(item)
+        finally:
+            connections.close_all()  # connections of worker thread
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        return list(executor.map(_work, items))
+
+
+def _warm_problems(ids):
+    snapshots = Problem.objects.load_snapshots(ids)
+    redis.preload(
+        {PROBLEM_KEY.format(id): snapshot for id, snapshot in snapshots.items()},
+        settings.DEBUG_REDIS_PROBLEM_TTL,
+    )
+    return len(snapshots)
+
+
+def warm(chunk_size=None, concurrency=None) -> dict:
+    """
+    preload problem snapshots by chunks, one query and one redis pipeline each,
+    then popular lists. returns counts of warmed problems and lists.
+    """
+    chunk_size = chunk_size if chunk_size else settings.CACHE_WARMUP_CHUNK_SIZE
+    concurrency = concurrency if concurrency else settings.CACHE_WARMUP_CONCURRENCY
+
+    rows = _problem_rows()
+    ids = [id for id, _, _ in rows]
+    chunks = [ids[i : i + chunk_size] for i in range(0, len(ids), chunk_size)]
+    problems = sum(_run(_warm_problems, chunks, concurrency))
+
+    filters = popular_filters(rows)
+    _run(lambda f: Problem.objects.get_cached_ids(*f), filters, concurrency)
+
+    return {"problems": problems, "lists": len(filters)}
+
+
+def estimate(chunk_size=None) -> dict:
+    """
+    estimated redis memory of warm(), bytes.
+    size of problem snapshot is sampled from first chunk, nothing is written.
+    """
+    chunk_size = chunk_size if chunk_size else settings.CACHE_WARMUP_CHUNK_SIZE
+
+    rows = _problem_rows()
+    sample = Problem.objects.load_snapshots([id for id, _, _ in rows[:chunk_size]])
+    sizes = [
+        len(PROBLEM_KEY.format(id))
+        + len(pickle.dumps((snapshot, 0, 0.0), pickle.HIGHEST_PROTOCOL))
+        for id, snapshot in sample.items()
+    ]
+    per_problem = sum(sizes) / len(sizes) if sizes else 0
+
+    level_counts = Counter(level for _, level, _ in rows)
+    category_counts = Counter(category for _, _, category in rows)
+
+    def _length(levels, categories):
+        if levels:
+            return level_counts[levels[0]]
+        if categories:
+            return category_counts[categories[0]]
+        return len(rows)
+
+    lengths = [_length(*f) for f in popular_filters(rows)]
+
+    problems_bytes = int(per_problem * len(rows))
+    lists_bytes = sum(8 * length + LIST_OVERHEAD for length in lengths)
+    return {
+        "problems": len(rows),
+        "problem_bytes": int(per_problem),
+        "problems_bytes": problems_bytes,
+        "lists": len(lengths),
+        "lists_bytes": lists_bytes,
+        "total_bytes": problems_bytes + lists_bytes,
+    }
+
+
+def warm_in_background():
+    """warm() in daemon thread, failure is logged only"""
+
+    def _warm():
+        try:
+            logger.info("cache warmed up, %s", warm())
+        except Exception:
+            logger.exception("cache warm up failed")
+        finally:
+            connections.close_all()
+
+    threading.Thread(target=_warm, name="cache-warmup", daemon=True).start()
+
+
+def warm_on_startup():
+    """
+    warm_in_background() if CACHE_WARMUP_ON_STARTUP,
+    call from server entry points only(wsgi, asgi), never management commands.
+    """
+    if settings.CACHE_WARMUP_ON_STARTUP:
+        warm_in_background()